@@ -5,17 +5,27 @@ Edinburgh University AI-Powered IT Support System
 """
 
 import psycopg
+from psycopg.rows import class_row
 import requests
+import httpx
+import numpy as np
 import json
+import logging
 import time
 import statistics
 import argparse
 import sys
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
 from flask import Flask, request, jsonify, render_template_string
 
+logger = logging.getLogger(__name__)
+
 # Database configuration
 DB_CONFIG = {
     "dbname": "pgvector",
@@ -31,6 +41,20 @@ EMBEDDING_MODEL = "bge-m3"
 OPENAI_API_KEY = "API_KEY"  # Replace with actual key
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 
+# Shared HTTP/2 client for OpenAI: keeps the TLS connection alive between
+# questions and multiplexes concurrent requests over it.
+_openai_client = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    timeout=30.0
+)
+
+# Search result cache configuration
+SEARCH_CACHE_SIZE = 512
+CORPUS_CHECK_INTERVAL = 30  # seconds between checks for ingested documents
+SEMANTIC_CACHE_SIZE = 1024
+SEMANTIC_CACHE_THRESHOLD = 0.95  # cosine similarity needed to reuse an answer
+
 @dataclass
 class SearchResult:
     """Represents a search result chunk."""
@@ -54,6 +78,140 @@ class RAGResponse:
     chunks_found: int
     success: bool
 
+# In-process LRU of search results keyed by quantized query embedding.
+# Bump _cache_epoch (via invalidate_search_cache) whenever document_chunks changes;
+# refresh_caches_if_corpus_changed does it for writes made by other processes.
+_search_cache: "OrderedDict[tuple, List[SearchResult]]" = OrderedDict()
+_search_cache_lock = threading.Lock()
+_cache_epoch = 0
+
+# Whether document_chunks has the embedding_h halfvec column (added by
+# `--migrate-halfvec`). Looked up on first search; None means not checked yet.
+_halfvec_ready: Optional[bool] = None
+
+def _search_cache_key(query_embedding: List[float], limit: int,
+                      similarity_threshold: float) -> tuple:
+    """Build a cache key so near-duplicate query embeddings share an entry."""
+    quantized = array('b', (round(value * 100) for value in query_embedding))
+    digest = hashlib.blake2b(quantized.tobytes(), digest_size=16).digest()
+    return (_cache_epoch, digest, limit, similarity_threshold)
+
+def invalidate_search_cache():
+    """Drop all cached search results after document_chunks is modified."""
+    global _cache_epoch, _halfvec_ready
+    with _search_cache_lock:
+        _cache_epoch += 1
+        _halfvec_ready = None
+        _search_cache.clear()
+        semantic_caches = list(_semantic_caches.values())
+    for semantic_cache in semantic_caches:
+        semantic_cache.clear()
+
+# A cheap version of document_chunks: its write counters (plus whether the
+# embedding_h column exists), read from the statistics views rather than
+# by scanning the table
+CORPUS_VERSION_SQL = """
+    SELECT n_tup_ins, n_tup_upd, n_tup_del, n_live_tup,
+           EXISTS (SELECT 1 FROM pg_attribute
+                   WHERE attrelid = 'document_chunks'::regclass
+                     AND attname = 'embedding_h' AND NOT attisdropped)
+    FROM pg_stat_user_tables
+    WHERE relid = 'document_chunks'::regclass;
+"""
+_corpus_version: Optional[tuple] = None
+_corpus_checked_at = 0.0
+
+def refresh_caches_if_corpus_changed():
+    """Drop cached searches and answers if document_chunks changed since the last check.
+    
+    Runs at most once per CORPUS_CHECK_INTERVAL, so documents ingested by
+    another process are searchable in a long-running server within that time.
+    """
+    global _corpus_version, _corpus_checked_at
+    now = time.monotonic()
+    with _search_cache_lock:
+        if now - _corpus_checked_at < CORPUS_CHECK_INTERVAL:
+            return
+        _corpus_checked_at = now
+    
+    try:
+        with psycopg.connect(**DB_CONFIG) as conn:
+            version = conn.execute(CORPUS_VERSION_SQL).fetchone()
+    except Exception as e:
+        logger.warning("⚠️  Corpus version check failed: %s", e)
+        return
+    
+    if version != _corpus_version:
+        if _corpus_version is not None:
+            logger.info("🔄 document_chunks changed - clearing cached searches and answers")
+        _corpus_version = version
+        invalidate_search_cache()
+
+class SemanticCache:
+    """Reuse RAG answers for questions whose embeddings are near-identical.
+    
+    Embeddings live in one contiguous float32 matrix (L2-normalised on insert),
+    so a lookup is a single matrix-vector product instead of a Python loop.
+    When full, the oldest entry is overwritten.
+    """
+    
+    def __init__(self, capacity: int = SEMANTIC_CACHE_SIZE, dimensions: int = 1024,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.threshold = threshold
+        self._vectors = np.empty((capacity, dimensions), dtype=np.float32)
+        self._responses: List[Optional[RAGResponse]] = [None] * capacity
+        self._count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _normalise(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def lookup(self, embedding: List[float]) -> Optional[RAGResponse]:
+        """Return the cached response closest to `embedding`, if close enough."""
+        query = self._normalise(embedding)
+        with self._lock:
+            if not self._count:
+                return None
+            similarities = self._vectors[:self._count] @ query
+            best = int(similarities.argmax())
+            if similarities[best] >= self.threshold:
+                return self._responses[best]
+        return None
+    
+    def add(self, embedding: List[float], response: RAGResponse):
+        """Store a response under its query embedding."""
+        vector = self._normalise(embedding)
+        with self._lock:
+            self._vectors[self._next] = vector
+            self._responses[self._next] = response
+            self._next = (self._next + 1) % len(self._responses)
+            self._count = min(self._count + 1, len(self._responses))
+    
+    def clear(self):
+        """Forget every cached response."""
+        with self._lock:
+            self._responses = [None] * len(self._responses)
+            self._count = 0
+            self._next = 0
+
+# One semantic cache per (max_chunks, similarity_threshold) combination
+_semantic_caches: Dict[tuple, SemanticCache] = {}
+
+def get_semantic_cache(max_chunks: int, similarity_threshold: float) -> SemanticCache:
+    """Return the semantic cache for these settings, creating it on first use."""
+    key = (max_chunks, similarity_threshold)
+    # Same lock invalidate_search_cache holds while it collects the caches;
+    # the cache (and its float32 matrix) is only built on a miss
+    with _search_cache_lock:
+        semantic_cache = _semantic_caches.get(key)
+        if semantic_cache is None:
+            semantic_cache = _semantic_caches[key] = SemanticCache()
+        return semantic_cache
+
 def get_embedding(text: str, max_retries: int = 3) -> Optional[List[float]]:
     """Generate embedding for text using Ollama BGE-M3 model."""
     for attempt in range(max_retries):
@@ -73,57 +231,123 @@ def get_embedding(text: str, max_retries: int = 3) -> Optional[List[float]]:
                 return embedding[0]
         except Exception as e:
             if attempt == max_retries - 1:
-                print(f"⚠️  Embedding failed: {e}")
+                logger.warning("⚠️  Embedding failed: %s", e)
             time.sleep(1)
     
     return None
 
+def ensure_halfvec_embeddings() -> bool:
+    """Add a half-precision copy of the embeddings with its own HNSW index.
+    
+    float16 halves the bytes read per index traversal (2 KB vs 4 KB per chunk).
+    Adding the stored column rewrites the table under an exclusive lock, so
+    this is an explicit step (`--migrate-halfvec`), not part of startup.
+    Safe to call repeatedly.
+    """
+    try:
+        with psycopg.connect(**DB_CONFIG) as conn:
+            with conn.cursor() as cur:
+                # Generated column keeps the float16 copy in sync with new inserts
+                cur.execute("""
+                    ALTER TABLE document_chunks
+                    ADD COLUMN IF NOT EXISTS embedding_h halfvec(1024)
+                    GENERATED ALWAYS AS (embedding::halfvec(1024)) STORED;
+                """)
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_doc_chunks_embedding_h
+                    ON document_chunks
+                    USING hnsw (embedding_h halfvec_cosine_ops);
+                """)
+            conn.commit()
+        invalidate_search_cache()
+        return True
+    except Exception as e:
+        logger.error("❌ Halfvec migration failed: %s", e)
+        return False
+
+HALFVEC_COLUMN_SQL = """
+    SELECT EXISTS (
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = 'document_chunks'::regclass
+          AND attname = 'embedding_h' AND NOT attisdropped
+    );
+"""
+
+def halfvec_ready(conn: psycopg.Connection) -> bool:
+    """True once the embedding_h column exists (checked once per cache epoch)."""
+    global _halfvec_ready
+    if _halfvec_ready is None:
+        _halfvec_ready = conn.execute(HALFVEC_COLUMN_SQL).fetchone()[0]
+        if not _halfvec_ready:
+            logger.info("ℹ️  No embedding_h column - searching full-precision embeddings "
+                        "(run with --migrate-halfvec to add it)")
+    return _halfvec_ready
+
 def search_similar_chunks(query: str, limit: int = 5, 
-                         similarity_threshold: float = 0.4) -> List[SearchResult]:
-    """Search for document chunks similar to the user query."""
-    print(f"🔍 Searching for chunks similar to: '{query}'")
+                         similarity_threshold: float = 0.4,
+                         query_embedding: Optional[List[float]] = None) -> List[SearchResult]:
+    """Search for document chunks similar to the user query.
     
-    query_embedding = get_embedding(query)
+    Pass `query_embedding` when the caller has already embedded the query.
+    """
+    logger.info("🔍 Searching for chunks similar to: '%s'", query)
+    
+    if query_embedding is None:
+        query_embedding = get_embedding(query)
     if not query_embedding:
-        print("❌ Failed to generate query embedding")
+        logger.error("❌ Failed to generate query embedding")
         return []
     
+    refresh_caches_if_corpus_changed()
+    cache_key = _search_cache_key(query_embedding, limit, similarity_threshold)
+    with _search_cache_lock:
+        cached = _search_cache.get(cache_key)
+        if cached is not None:
+            _search_cache.move_to_end(cache_key)
+            logger.info("⚡ Cache hit: %d relevant chunks", len(cached))
+            return list(cached)
+    
     try:
         with psycopg.connect(**DB_CONFIG) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
+            # Rows are built straight into SearchResult by column name
+            with conn.cursor(row_factory=class_row(SearchResult)) as cur:
+                # The threshold is applied in SQL, so let HNSW visit more
+                # candidates to still fill `limit` rows (transaction-local)
+                cur.execute("SELECT set_config('hnsw.ef_search', %s, true);",
+                            (str(min(max(limit * 8, 40), 1000)),))
+                
+                # The half-precision copy when it exists, the original otherwise
+                column, vector_type = (("embedding_h", "halfvec") if halfvec_ready(conn)
+                                       else ("embedding", "vector"))
+                cur.execute(f"""
                     SELECT 
-                        id,
+                        id AS chunk_id,
                         text,
                         document_title,
                         page_number,
                         section_title,
-                        1 - (embedding <=> %s::vector) as similarity_score
+                        1 - ({column} <=> %s::{vector_type}) as similarity_score
                     FROM document_chunks
-                    WHERE embedding IS NOT NULL
-                    ORDER BY embedding <=> %s::vector
+                    WHERE {column} IS NOT NULL
+                      AND ({column} <=> %s::{vector_type}) <= %s
+                    ORDER BY {column} <=> %s::{vector_type}
                     LIMIT %s;
-                """, (query_embedding, query_embedding, limit))
+                """, (query_embedding, query_embedding, 1 - similarity_threshold,
+                      query_embedding, limit))
                 
-                results = cur.fetchall()
+                search_results = cur.fetchall()
                 
-                search_results = []
-                for chunk_id, text, doc_title, page_num, section, similarity in results:
-                    if similarity >= similarity_threshold:
-                        search_results.append(SearchResult(
-                            text=text,
-                            document_title=doc_title,
-                            page_number=page_num,
-                            section_title=section,
-                            similarity_score=similarity,
-                            chunk_id=chunk_id
-                        ))
+                logger.info("✅ Found %d relevant chunks (similarity > %s)",
+                            len(search_results), similarity_threshold)
                 
-                print(f"✅ Found {len(search_results)} relevant chunks (similarity > {similarity_threshold})")
-                return search_results
+                with _search_cache_lock:
+                    _search_cache[cache_key] = search_results
+                    if len(_search_cache) > SEARCH_CACHE_SIZE:
+                        _search_cache.popitem(last=False)
+                return list(search_results)
                 
     except Exception as e:
-        print(f"❌ Search failed: {e}")
+        logger.error("❌ Search failed: %s", e)
         return []
 
 def assemble_context(search_results: List[SearchResult], 
@@ -136,7 +360,7 @@ def assemble_context(search_results: List[SearchResult],
     sources = []
     total_tokens = 0
     
-    print(f"🧩 Assembling context from {len(search_results)} chunks...")
+    logger.info("🧩 Assembling context from %d chunks...", len(search_results))
     
     for i, result in enumerate(search_results):
         source_info = {
@@ -160,23 +384,23 @@ def assemble_context(search_results: List[SearchResult],
         chunk_tokens = len(chunk_text) // 4
         
         if total_tokens + chunk_tokens > max_tokens:
-            print(f"⚠️  Stopping at {i} chunks to stay within {max_tokens} token limit")
+            logger.info("⚠️  Stopping at %d chunks to stay within %d token limit", i, max_tokens)
             break
         
         context_parts.append(chunk_text)
         sources.append(source_info)
         total_tokens += chunk_tokens
         
-        print(f"   ✅ Added chunk {i+1}: {result.document_title} ({chunk_tokens} tokens)")
+        logger.debug("   ✅ Added chunk %d: %s (%d tokens)", i + 1, result.document_title, chunk_tokens)
     
     assembled_context = "\n".join(context_parts)
-    print(f"📊 Final context: {total_tokens} estimated tokens from {len(sources)} sources")
+    logger.info("📊 Final context: %d estimated tokens from %d sources", total_tokens, len(sources))
     
     return assembled_context, sources
 
 def generate_llm_response(query: str, context: str, api_key: str) -> Dict[str, Any]:
     """Generate response using OpenAI API with Edinburgh-specific prompting."""
-    print(f"🤖 Generating LLM response for: '{query[:50]}...'")
+    logger.info("🤖 Generating LLM response for: '%.50s...'", query)
     
     system_prompt = """You are an AI assistant for Edinburgh University's IT Services.
 
@@ -218,7 +442,7 @@ Please provide a helpful, accurate answer based on the context above. Remember t
         }
         
         # Make the API request
-        response = requests.post(
+        response = _openai_client.post(
             OPENAI_API_URL,
             headers=headers,
             json=payload,
@@ -237,7 +461,7 @@ Please provide a helpful, accurate answer based on the context above. Remember t
         tokens_used = usage.get('total_tokens', 0)
         cost_estimate = tokens_used * 0.000002  # Approximate cost for gpt-3.5-turbo
         
-        print(f"✅ Generated response: {len(answer)} characters, {tokens_used} tokens")
+        logger.info("✅ Generated response: %d characters, %d tokens", len(answer), tokens_used)
         
         return {
             'answer': answer,
@@ -247,7 +471,7 @@ Please provide a helpful, accurate answer based on the context above. Remember t
             'success': True
         }
         
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         if e.response.status_code == 429:
             return {
                 'answer': "I'm currently experiencing high demand. Please try again in a moment.",
@@ -265,7 +489,7 @@ Please provide a helpful, accurate answer based on the context above. Remember t
                 'success': False
             }
         else:
-            print(f"❌ OpenAI API HTTP error: {e}")
+            logger.error("❌ OpenAI API HTTP error: %s", e)
             return {
                 'answer': f"I'm experiencing technical difficulties (HTTP {e.response.status_code}). Please try again or contact IT Services at 0131 650 4500.",
                 'tokens_used': 0,
@@ -274,8 +498,8 @@ Please provide a helpful, accurate answer based on the context above. Remember t
                 'success': False
             }
         
-    except requests.exceptions.RequestException as e:
-        print(f"❌ OpenAI API request error: {e}")
+    except httpx.RequestError as e:
+        logger.error("❌ OpenAI API request error: %s", e)
         return {
             'answer': "I'm experiencing network difficulties. Please try again or contact IT Services at 0131 650 4500.",
             'tokens_used': 0,
@@ -285,7 +509,7 @@ Please provide a helpful, accurate answer based on the context above. Remember t
         }
         
     except Exception as e:
-        print(f"❌ OpenAI API error: {e}")
+        logger.error("❌ OpenAI API error: %s", e)
         return {
             'answer': "I'm experiencing technical difficulties. Please try again or contact IT Services at 0131 650 4500.",
             'tokens_used': 0,
@@ -317,12 +541,24 @@ def answer_question(query: str, api_key: str,
     """Complete RAG pipeline: search → assemble → generate → respond"""
     start_time = time.time()
     
-    print(f"\n🚀 PROCESSING RAG QUERY: '{query}'")
-    print("="*80)
+    logger.info("🚀 PROCESSING RAG QUERY: '%s'", query)
+    
+    # Reuse the answer to a near-identical earlier question if we have one
+    query_embedding = get_embedding(query)
+    semantic_cache = None
+    if query_embedding:
+        refresh_caches_if_corpus_changed()
+        semantic_cache = get_semantic_cache(max_chunks, similarity_threshold)
+        cached_response = semantic_cache.lookup(query_embedding)
+        if cached_response is not None:
+            logger.info("⚡ Semantic cache hit - reusing previous answer")
+            return replace(cached_response, query=query,
+                           response_time=time.time() - start_time)
     
     # Step 1: Search for relevant chunks
-    print("Step 1: Searching for relevant chunks...")
-    search_results = search_similar_chunks(query, max_chunks, similarity_threshold)
+    logger.info("Step 1: Searching for relevant chunks...")
+    search_results = search_similar_chunks(query, max_chunks, similarity_threshold,
+                                           query_embedding=query_embedding)
     
     if not search_results:
         return RAGResponse(
@@ -339,15 +575,15 @@ def answer_question(query: str, api_key: str,
         )
     
     # Step 2: Assemble context
-    print("Step 2: Assembling context...")
+    logger.info("Step 2: Assembling context...")
     context, sources = assemble_context(search_results)
     
     # Step 3: Determine confidence level
     confidence = determine_confidence_level(search_results)
-    print(f"Step 3: Confidence level: {confidence}")
+    logger.info("Step 3: Confidence level: %s", confidence)
     
     # Step 4: Generate response
-    print("Step 4: Generating LLM response...")
+    logger.info("Step 4: Generating LLM response...")
     llm_response = generate_llm_response(query, context, api_key)
     
     # Step 5: Finalize response
@@ -371,11 +607,11 @@ def answer_question(query: str, api_key: str,
         success=llm_response['success']
     )
     
-    print(f"\n✅ RAG PIPELINE COMPLETE")
-    print(f"   Response time: {response_time:.2f}s")
-    print(f"   Confidence: {confidence}")
-    print(f"   Chunks used: {len(search_results)}")
-    print(f"   Tokens: {llm_response['tokens_used']}")
+    if semantic_cache is not None and rag_response.success:
+        semantic_cache.add(query_embedding, rag_response)
+    
+    logger.info("✅ RAG PIPELINE COMPLETE: %.2fs, confidence=%s, chunks=%d, tokens=%d",
+                response_time, confidence, len(search_results), llm_response['tokens_used'])
     
     return rag_response
 
@@ -408,9 +644,19 @@ def validate_rag_system() -> Dict[str, Any]:
     try:
         with psycopg.connect(**DB_CONFIG) as conn:
             with conn.cursor() as cur:
-                cur.execute("SELECT COUNT(*) FROM document_chunks WHERE embedding IS NOT NULL;")
+                # Binary result format: the count arrives as an int8, no text parsing
+                cur.execute("SELECT COUNT(*) FROM document_chunks WHERE embedding IS NOT NULL;",
+                            binary=True)
                 chunk_count = cur.fetchone()[0]
                 print(f"✅ Database: {chunk_count} chunks with embeddings available")
+            
+            # Report which column searches use; adding the halfvec copy rewrites
+            # the table, so it's left to `--migrate-halfvec` rather than done here
+            if halfvec_ready(conn):
+                print("✅ Halfvec index: searching embedding_h halfvec(1024)")
+            else:
+                print("ℹ️  Halfvec index: not set up - searching embedding "
+                      "(python lab6_rag_pipeline.py --migrate-halfvec)")
     except Exception as e:
         print(f"❌ Database error: {e}")
         return {"status": "failed", "error": "database_connection"}
@@ -631,7 +877,14 @@ def create_rag_web_interface():
     return app
 
 def start_web_interface(port: int = 5100, debug: bool = True):
-    """Start the web interface for interactive testing."""
+    """Start the web interface for interactive testing.
+    
+    `debug=True` uses the Flask development server; otherwise the app is
+    served by waitress.
+    """
+    # Keep per-request pipeline logging quiet under the web server
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    
     print("🌐 Starting Edinburgh IT Support Web Interface...")
     print(f"   Port: {port}")
     print(f"   Debug mode: {debug}")
@@ -654,7 +907,13 @@ def start_web_interface(port: int = 5100, debug: bool = True):
     
     # Create and start the web app
     app = create_rag_web_interface()
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    if debug:
+        # Flask dev server: reloader and debugger, one request at a time
+        app.run(host='0.0.0.0', port=port, debug=True)
+    else:
+        # Production WSGI server: thread pool with keep-alive connections
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=port, threads=8, connection_limit=1000)
 
 def main():
     """Main RAG system demonstration and testing."""
@@ -668,15 +927,26 @@ def main():
                        help='Enable debug mode for web interface')
     parser.add_argument('--no-debug', action='store_true',
                        help='Disable debug mode for web interface')
+    parser.add_argument('--migrate-halfvec', action='store_true',
+                       help='Add the half-precision embedding_h column and index, then exit')
     
     args = parser.parse_args()
     
+    # One-off migration: rewrites document_chunks, so run it while idle
+    if args.migrate_halfvec:
+        if ensure_halfvec_embeddings():
+            print("✅ Halfvec index: embedding_h halfvec(1024) ready")
+            return 0
+        return 1
+    
     # If web interface requested, start it
     if args.web:
         debug_mode = args.debug and not args.no_debug
         return start_web_interface(port=args.port, debug=debug_mode)
     
-    # Otherwise run the normal demonstration
+    # Otherwise run the normal demonstration, showing pipeline progress
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    
     print("🚀 SECTION 6: RAG PIPELINE INTEGRATION")
     print("="*80)
     print("Edinburgh University AI-Powered IT Support System\n")
@@ -2,38 +2,54 @@
 """
 Standalone script to start the RAG web interface.
 This provides an easy way to start the web interface without running all tests.
+
+Run from section-06-rag-pipeline/ as a module:
+    python -m solution.start_web_interface
 """
 
-import sys
+import argparse
+import logging
 import os
+import sys
 
-# Add the current directory to the path so we can import the main module
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from .lab6_rag_pipeline import start_web_interface
 
-from lab6_rag_pipeline import start_web_interface
+log = logging.getLogger(__name__)
 
-def main():
-    """Start the web interface with default settings."""
-    print("🌐 Edinburgh University RAG Pipeline - Web Interface")
-    print("=" * 60)
+def main(dev: bool = False):
+    """Start the web interface with default settings.
+    
+    Served by waitress unless `dev` is set, which uses the Flask development
+    server with the debugger and reloader.
+    """
+    log.info("🌐 Edinburgh University RAG Pipeline - Web Interface")
+    log.info("=" * 60)
     
     # Check if API key is set
     api_key = os.getenv('OPENAI_API_KEY')
     if not api_key or api_key == "your-api-key-here":
-        print("⚠️  Warning: OPENAI_API_KEY not set or using placeholder value")
-        print("   The web interface will work but won't generate AI responses")
-        print("   Set your API key: export OPENAI_API_KEY='your-actual-key'")
-        print()
+        log.warning("⚠️  Warning: OPENAI_API_KEY not set or using placeholder value")
+        log.warning("   The web interface will work but won't generate AI responses")
+        log.warning("   Set your API key: export OPENAI_API_KEY='your-actual-key'")
     
     try:
         # Start the web interface
-        start_web_interface(port=5100, debug=True)
+        start_web_interface(port=5100, debug=dev)
     except KeyboardInterrupt:
-        print("\n\n👋 Web interface stopped by user")
+        log.info("👋 Web interface stopped by user")
         return 0
     except Exception as e:
-        print(f"\n❌ Error starting web interface: {e}")
+        log.error("❌ Error starting web interface: %s", e)
         return 1
 
 if __name__ == "__main__":
-    exit(main())
+    # Pipeline modules stay at WARNING under the web server; this script's
+    # own status lines are still shown
+    logging.basicConfig(level=logging.WARNING, format="%(message)s", stream=sys.stdout)
+    log.setLevel(logging.INFO)
+    
+    parser = argparse.ArgumentParser(description='Start the RAG web interface')
+    parser.add_argument('--dev', action='store_true',
+                        help='Use the Flask development server with debug mode')
+    args = parser.parse_args()
+    exit(main(dev=args.dev))
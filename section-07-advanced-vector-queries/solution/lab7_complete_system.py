@@ -7,13 +7,32 @@ This solution demonstrates advanced PostgreSQL + pgvector query patterns
 combining semantic similarity with relational filtering and JSONB metadata.
 """
 
+import numpy as np
+import orjson
 import psycopg
+from psycopg.types.json import Jsonb, set_json_loads
+from pgvector.psycopg import register_vector, register_vector_async
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 import requests
+from requests.adapters import HTTPAdapter
+from tenacity import (
+    before_sleep_log,
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter
+)
+import httpx
+import asyncio
 import json
 import logging
+import queue
+import threading
 import time
+from concurrent.futures import Future
+from collections import deque
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
 from dataclasses import dataclass, asdict
 from contextlib import contextmanager
 
@@ -24,7 +43,118 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Query embedding cache: entries with the lowest Distance-Rank Frequency
+# (DRF) score are evicted first, so queries that keep producing close,
+# top-ranked hits stay cached. Scores decay by DRF_DECAY on every insert,
+# so old favourites fade unless they keep scoring, and new entries start at
+# the current mean so they aren't evicted before their first search credits them
+EMBED_CACHE_SIZE = 1000
+DRF_ALPHA = 1.0
+DRF_TOP_K = 10
+DRF_DECAY = 0.999  # halves a score over ~700 inserts
+
+# Concurrent embedding requests are coalesced into one Ollama call of up
+# to EMBED_BATCH_SIZE texts, waiting at most EMBED_BATCH_WAIT seconds
+EMBED_BATCH_SIZE = 16
+EMBED_BATCH_WAIT = 0.005
+
+def is_retryable_embedding_error(exc: BaseException) -> bool:
+    """
+    Retry connection failures, timeouts and 5xx responses only.
+    
+    A 4xx (e.g. unknown model) or a malformed response will fail the same
+    way again, so it is raised immediately.
+    """
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, httpx.TransportError)):
+        return True
+    if isinstance(exc, (requests.HTTPError, httpx.HTTPStatusError)) and exc.response is not None:
+        return exc.response.status_code >= 500
+    return False
+
+# Up to 3 attempts, backing off from 50ms with jitter
+embedding_retry = retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=0.05, max=1.0),
+    retry=retry_if_exception(is_retryable_embedding_error),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True
+)
+
+# Per-query timings kept in a fixed-size NumPy ring buffer, so monitoring
+# memory stays bounded and aggregates are vectorised
+STATS_CAPACITY = 10000
+STATS_DTYPE = np.dtype([
+    ('exec', 'f4'),
+    ('results', 'i4'),
+    ('embed', 'f4'),
+    ('db', 'f4')
+])
+RECENT_QUERIES_SIZE = 100
+
+# Rows fetched per round-trip when streaming results from a server-side cursor
+STREAM_ITERSIZE = 64
+
+# Nearest neighbours pulled from the HNSW index before final scoring
+CANDIDATE_LIMIT = 200
+
+# Candidate query shapes compared with EXPLAIN per filter combination;
+# choices are re-made when the table size changes by more than 10%
+QUERY_SHAPES = ('hnsw', 'filter_first')
+PLAN_CACHE_ROW_DELTA = 0.1
+PLAN_CACHE_CHECK_INTERVAL = 60  # seconds between table-size checks
+TABLE_ROWS_SQL = "SELECT reltuples FROM pg_class WHERE oid = 'document_chunks'::regclass"
+
+# Vector distance against the full-precision index, or against the
+# half-precision (halfvec) expression index built by setup_enhanced_database
+VECTOR_DISTANCE = "embedding <=> %b"
+HALFVEC_DISTANCE = "embedding::halfvec(1024) <=> %b::halfvec(1024)"
+
+# Reciprocal Rank Fusion: the RRF_LIST_SIZE nearest filtered chunks (one
+# HNSW scan) are ranked once per signal below, and a document at rank r in
+# a ranking scores 1 / (RRF_K + r). Chunks added after
+# setup_enhanced_database have NULL columns; NULLS LAST keeps them from
+# sorting first (DESC puts NULLs first by default).
+RRF_K = 60
+RRF_LIST_SIZE = 50
+RRF_ORDERINGS = {
+    'semantic': "dist",
+    'priority': "priority DESC NULLS LAST, view_count DESC NULLS LAST",
+    'recency': "last_reviewed DESC NULLS LAST"
+}
+
+# Keep scanning the HNSW graph until enough rows pass the filters
+# (pgvector >= 0.8); otherwise selective filters leave almost no results
+HNSW_SESSION_SETTINGS = [
+    "SET hnsw.iterative_scan = strict_order",
+    "SET hnsw.max_scan_tuples = 20000",
+    "SET hnsw.scan_mem_multiplier = 2"
+]
+
+def configure_connection(conn: psycopg.Connection):
+    """Pool configure callback: pgvector codec, orjson JSONB loader, HNSW scan settings."""
+    register_vector(conn)
+    set_json_loads(orjson.loads, conn)
+    try:
+        for setting in HNSW_SESSION_SETTINGS:
+            conn.execute(setting)
+        conn.commit()
+    except psycopg.Error as e:
+        conn.rollback()
+        logger.warning(f"HNSW iterative scan unavailable (needs pgvector 0.8+): {e}")
+
+async def configure_async_connection(conn: psycopg.AsyncConnection):
+    """Async counterpart of configure_connection."""
+    await register_vector_async(conn)
+    set_json_loads(orjson.loads, conn)
+    try:
+        for setting in HNSW_SESSION_SETTINGS:
+            await conn.execute(setting)
+        await conn.commit()
+    except psycopg.Error as e:
+        await conn.rollback()
+        logger.warning(f"HNSW iterative scan unavailable (needs pgvector 0.8+): {e}")
+
+@dataclass(slots=True)
 class SearchResult:
     """Structured search result with all metadata."""
     document_title: str
@@ -39,7 +169,7 @@ class SearchResult:
         """Convert to dictionary for JSON serialization."""
         return asdict(self)
 
-@dataclass  
+@dataclass(slots=True)
 class QueryConfig:
     """Configuration parameters for hybrid queries."""
     similarity_threshold: float = 0.4
@@ -49,8 +179,9 @@ class QueryConfig:
     popularity_weight: float = 0.1
     department_weight: float = 0.1
     timeout_seconds: int = 30
+    use_halfvec: bool = False  # Search the half-precision HNSW index instead
 
-@dataclass
+@dataclass(slots=True)
 class QueryStats:
     """Query performance statistics."""
     query: str
@@ -60,6 +191,80 @@ class QueryStats:
     db_time: float
     filters_applied: Dict[str, Any]
 
+class EmbeddingBatcher:
+    """
+    Coalesce concurrent embedding requests into batched Ollama calls.
+    
+    Callers submit single texts and get a Future back. A background thread
+    collects up to `max_batch` texts, waiting at most `max_wait` seconds
+    after the first one, and embeds them with a single request.
+    """
+    
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], List[np.ndarray]],
+        max_batch: int = EMBED_BATCH_SIZE,
+        max_wait: float = EMBED_BATCH_WAIT
+    ):
+        self.embed_batch = embed_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def submit(self, text: str) -> Future:
+        """Queue a text for embedding; the Future resolves to its vector."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._thread.start()
+        
+        future = Future()
+        self._queue.put((text, future))
+        return future
+    
+    def close(self):
+        """Finish queued requests and stop the background thread."""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            
+            # Gather more requests until the batch is full or the wait expires
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # Stop after this batch
+                    break
+                batch.append(item)
+            
+            try:
+                embeddings = self.embed_batch([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), embedding in zip(batch, embeddings):
+                    future.set_result(embedding)
+
 class EdinburghHybridSearch:
     """
     Production-ready hybrid search system for Edinburgh University.
@@ -81,63 +286,175 @@ class EdinburghHybridSearch:
             'password': 'postgres'
         }
         
+        # Connections are reused across searches; the pool opens on first use.
+        # Each connection gets the pgvector codec, so embeddings travel as
+        # binary float32 vectors instead of ~15KB of text.
+        self.pool = ConnectionPool(
+            kwargs=self.db_config,
+            configure=configure_connection,
+            min_size=2,
+            max_size=10,
+            open=False
+        )
+        # Async path: its own pool and HTTP client, bound to the caller's event loop
+        self.async_pool = AsyncConnectionPool(
+            kwargs=self.db_config,
+            configure=configure_async_connection,
+            min_size=5,
+            max_size=20,
+            open=False
+        )
+        self.async_http = httpx.AsyncClient(
+            timeout=30,
+            limits=httpx.Limits(max_connections=32, keepalive_expiry=60)
+        )
+        
         self.ollama_url = 'http://localhost:11434/api/embed'
-        self.stats = []  # Query statistics for monitoring
+        # Keep-alive connections to Ollama, enough for concurrent callers
+        self.http = requests.Session()
+        self.http.mount('http://', HTTPAdapter(pool_connections=16, pool_maxsize=64))
+        self.embedding_batcher = EmbeddingBatcher(self.get_embeddings_batch)
+        # Query statistics for monitoring
+        self.stats = np.zeros(STATS_CAPACITY, dtype=STATS_DTYPE)
+        self.stats_count = 0  # Total searches recorded; next slot is count % capacity
+        self.recent_queries = deque(maxlen=RECENT_QUERIES_SIZE)  # Latest QueryStats
+        self._stats_lock = threading.Lock()
+        
+        # Normalised query text -> [embedding, DRF score]
+        self._embed_cache: Dict[str, List[Any]] = {}
+        self._embed_cache_lock = threading.Lock()
+        
+        # Filter-shape key -> cheapest query shape (see choose_query_shape)
+        self._plan_cache: Dict[Tuple, str] = {}
+        self._plan_cache_rows = None  # Table size when the cache was filled
+        self._plan_cache_checked = 0.0
         
         logger.info("Edinburgh Hybrid Search system initialized")
     
     @contextmanager
     def get_db_connection(self):
-        """Database connection context manager with error handling."""
-        conn = None
+        """Borrow a pooled connection; it is returned to the pool on exit."""
+        if self.pool.closed:
+            self.pool.open()
         try:
-            conn = psycopg.connect(**self.db_config)
-            yield conn
+            with self.pool.connection() as conn:
+                yield conn
         except Exception as e:
             logger.error(f"Database connection error: {e}")
             raise
-        finally:
-            if conn:
-                conn.close()
     
-    def get_embedding(self, text: str, max_retries: int = 3) -> List[float]:
+    def close(self):
+        """Close all pooled connections and the embedding client."""
+        self.embedding_batcher.close()
+        self.http.close()
+        self.pool.close()
+    
+    async def aclose(self):
+        """Close the async pool and HTTP client."""
+        await self.async_pool.close()
+        await self.async_http.aclose()
+    
+    @staticmethod
+    def _embed_cache_key(text: str) -> str:
+        return text.strip().lower()
+    
+    def _cached_embedding(self, text: str) -> Optional[np.ndarray]:
+        with self._embed_cache_lock:
+            entry = self._embed_cache.get(self._embed_cache_key(text))
+        return entry[0] if entry else None
+    
+    def _cache_embedding(self, text: str, embedding: np.ndarray):
+        """Store an embedding, evicting the lowest-DRF entry when full."""
+        key = self._embed_cache_key(text)
+        with self._embed_cache_lock:
+            if key in self._embed_cache:
+                return
+            entries = self._embed_cache.values()
+            for entry in entries:
+                entry[1] *= DRF_DECAY
+            initial_score = sum(entry[1] for entry in entries) / len(entries) if entries else 0.0
+            if len(self._embed_cache) >= EMBED_CACHE_SIZE:
+                coldest = min(self._embed_cache, key=lambda k: self._embed_cache[k][1])
+                del self._embed_cache[coldest]
+            self._embed_cache[key] = [embedding, initial_score]
+    
+    def _record_drf(self, query: str, results: List[SearchResult]):
+        """Credit the query's cache entry with 1 / (rank * distance^alpha) per top hit."""
+        score = 0.0
+        for rank, result in enumerate(results[:DRF_TOP_K], 1):
+            distance = max(1 - result.similarity, 1e-6)
+            score += 1 / (rank * distance ** DRF_ALPHA)
+        
+        with self._embed_cache_lock:
+            entry = self._embed_cache.get(self._embed_cache_key(query))
+            if entry:
+                entry[1] += score
+    
+    def get_embedding(self, text: str) -> np.ndarray:
         """
-        Generate embedding using Ollama with retry logic.
+        Generate embedding using Ollama.
+        
+        Repeated queries are served from the in-process embedding cache;
+        otherwise the request joins the next batched Ollama call.
         
         Args:
             text: Input text to embed
-            max_retries: Maximum retry attempts
             
         Returns:
-            List of embedding values
+            float32 embedding vector
         """
-        for attempt in range(max_retries):
-            try:
-                start_time = time.time()
-                
-                response = requests.post(
-                    self.ollama_url,
-                    json={
-                        'model': 'bge-m3',
-                        'input': text
-                    },
-                    timeout=30
-                )
-                response.raise_for_status()
-                
-                embedding_time = time.time() - start_time
-                logger.debug(f"Embedding generated in {embedding_time:.3f}s")
-                
-                return response.json()['embeddings'][0]
-                
-            except Exception as e:
-                logger.warning(f"Embedding attempt {attempt + 1} failed: {e}")
-                if attempt == max_retries - 1:
-                    logger.error(f"All embedding attempts failed for: {text[:50]}...")
-                    raise
-                time.sleep(0.5)  # Brief pause before retry
+        cached = self._cached_embedding(text)
+        if cached is not None:
+            return cached
+        
+        return self.embedding_batcher.submit(text).result()
+    
+    @embedding_retry
+    def _post_embeddings(self, texts: List[str]) -> np.ndarray:
+        """One Ollama embed request; retried by embedding_retry."""
+        response = self.http.post(
+            self.ollama_url,
+            json={
+                'model': 'bge-m3',
+                'input': texts
+            },
+            timeout=30
+        )
+        response.raise_for_status()
+        
+        # float32 is what pgvector stores; 4KB per vector instead of
+        # ~28KB of Python floats, sent as-is by the binary codec
+        return np.asarray(orjson.loads(response.content)['embeddings'], dtype=np.float32)
+    
+    def get_embeddings_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Embed several texts with one Ollama request, with retry logic.
+        
+        Args:
+            texts: Input texts to embed
+            
+        Returns:
+            One float32 embedding vector per input text, in order
+        """
+        embeddings = {text: self._cached_embedding(text) for text in texts}
+        missing = [text for text, embedding in embeddings.items() if embedding is None]
+        if not missing:
+            return [embeddings[text] for text in texts]
+        
+        start_time = time.time()
+        try:
+            vectors = self._post_embeddings(missing)
+        except Exception as e:
+            logger.error(f"Embedding failed for {len(missing)} texts: {e}")
+            raise
+        
+        embedding_time = time.time() - start_time
+        logger.debug(f"{len(missing)} embeddings generated in {embedding_time:.3f}s")
         
-        return []
+        for text, embedding in zip(missing, vectors):
+            embeddings[text] = embedding
+            self._cache_embedding(text, embedding)
+        return [embeddings[text] for text in texts]
     
     def build_query_conditions(
         self, 
@@ -147,6 +464,11 @@ class EdinburghHybridSearch:
         """
         Build dynamic WHERE conditions and parameters from filters.
         
+        Scalar filters use the columns promoted from metadata by
+        setup_enhanced_database, so they can use btree indexes. Tag and
+        title filters come from build_tag_title_conditions; the vector
+        distance threshold is applied by build_search_query.
+        
         Args:
             filters: Dictionary of filter criteria
             params: Existing parameter list to extend
@@ -156,64 +478,87 @@ class EdinburghHybridSearch:
         """
         conditions = []
         
-        # Base vector similarity threshold
-        conditions.append("embedding <=> %s::vector < %s")
-        params.extend([filters.get('_query_embedding'), filters.get('similarity_threshold', 0.4)])
-        
         # Department filter
         if filters.get('department'):
-            conditions.append("metadata->>'department' = %s")
+            conditions.append("department = %s")
             params.append(filters['department'])
         
         # Campus filter
         if filters.get('campus'):
-            conditions.append("metadata->>'campus' = %s")
+            conditions.append("campus = %s")
             params.append(filters['campus'])
         
         # Document type filter
         if filters.get('doc_type'):
-            conditions.append("metadata->>'doc_type' = %s")
+            conditions.append("doc_type = %s")
             params.append(filters['doc_type'])
         
         # Priority filter (minimum level)
         if filters.get('min_priority'):
-            conditions.append("(metadata->>'priority')::int >= %s")
+            conditions.append("priority >= %s")
             params.append(filters['min_priority'])
         
         # Status filter (active/inactive)
         if filters.get('status'):
-            conditions.append("metadata->>'status' = %s")
+            conditions.append("status = %s")
             params.append(filters['status'])
         
-        # Tag containment (any of the tags)
-        if filters.get('tags_any'):
-            conditions.append("metadata->'tags' ?| %s")
-            params.append(filters['tags_any'])
-        
-        # Tag containment (all of the tags)
-        if filters.get('tags_all'):
-            conditions.append("metadata->'tags' ?& %s")
-            params.append(filters['tags_all'])
-        
         # Date range filters
         if filters.get('since_date'):
-            conditions.append("(metadata->>'last_reviewed')::timestamp >= %s")
+            conditions.append("last_reviewed >= %s")
             params.append(filters['since_date'])
         
         if filters.get('until_date'):
-            conditions.append("(metadata->>'last_reviewed')::timestamp <= %s")
+            conditions.append("last_reviewed <= %s")
             params.append(filters['until_date'])
         
         # View count filter (minimum popularity)
         if filters.get('min_views'):
-            conditions.append("(metadata->>'view_count')::int >= %s")
+            conditions.append("view_count >= %s")
             params.append(filters['min_views'])
         
         # Clearance level filter (maximum access level)
         if filters.get('max_clearance'):
-            conditions.append("(metadata->>'clearance_level')::int <= %s")
+            conditions.append("clearance_level <= %s")
             params.append(filters['max_clearance'])
         
+        return conditions, params
+    
+    def build_tag_title_conditions(
+        self, 
+        filters: Dict[str, Any], 
+        params: List[Any]
+    ) -> Tuple[List[str], List[Any]]:
+        """
+        Build the expensive WHERE conditions (JSONB tags, title substring).
+        
+        These still run inside the candidate scan, never on its output:
+        filtering a fixed-size candidate list afterwards would drop matches
+        whenever the filters are selective.
+        
+        Args:
+            filters: Dictionary of filter criteria
+            params: Existing parameter list to extend
+            
+        Returns:
+            Tuple of (conditions list, updated params)
+        """
+        conditions = []
+        
+        # Tag filters are written as metadata @> containment so the
+        # jsonb_path_ops GIN index can answer them
+        
+        # Tag containment (any of the tags): one @> per tag, OR'd
+        if filters.get('tags_any'):
+            tag_checks = ["metadata @> %s"] * len(filters['tags_any'])
+            conditions.append(f"({' OR '.join(tag_checks)})")
+            params.extend(Jsonb({'tags': [tag]}) for tag in filters['tags_any'])
+        
+        # Tag containment (all of the tags): a single @>
+        if filters.get('tags_all'):
+            conditions.append("metadata @> %s")
+            params.append(Jsonb({'tags': list(filters['tags_all'])}))
+        
         # Document title contains
         if filters.get('title_contains'):
             conditions.append("document_title ILIKE %s")
@@ -221,62 +566,296 @@ class EdinburghHybridSearch:
         
         return conditions, params
     
-    def build_scoring_expression(
+    def score_candidates(
         self, 
+        features: np.ndarray, 
         config: QueryConfig, 
-        filters: Dict[str, Any], 
-        params: List[Any]
-    ) -> Tuple[str, List[Any]]:
+        filters: Dict[str, Any]
+    ) -> np.ndarray:
         """
-        Build dynamic scoring expression with configurable weights.
+        Compute combined scores for all candidates at once with NumPy.
+        
+        Scoring happens in Python rather than SQL, so weights never reach
+        the database and can change freely without new query plans.
         
         Args:
+            features: (n, 6) array of similarity, priority, view_count,
+                department_match, campus_match, is_recent
             config: Query configuration with weights
-            filters: Query filters
-            params: Parameter list to extend
+            filters: Query filters (enable the optional bonuses)
             
         Returns:
-            Tuple of (scoring SQL expression, updated params)
+            Array of n combined scores
         """
-        score_components = []
-        
-        # Semantic similarity component (always included)
-        score_components.append(f"(1 - (embedding <=> %s::vector)) * {config.similarity_weight}")
-        params.append(filters.get('_query_embedding'))
+        similarity, priority, view_count, department_match, campus_match, is_recent = features.T
         
-        # Priority component
-        score_components.append(f"LEAST((metadata->>'priority')::float / 5.0, 1.0) * {config.priority_weight}")
-        
-        # Popularity component (view count)
-        score_components.append(f"LEAST((metadata->>'view_count')::float / 5000.0, 1.0) * {config.popularity_weight}")
+        # Semantic similarity, priority and popularity components
+        scores = (
+            similarity * config.similarity_weight
+            + np.minimum(priority / 5.0, 1.0) * config.priority_weight
+            + np.minimum(view_count / 5000.0, 1.0) * config.popularity_weight
+        )
         
         # Department match bonus
         if filters.get('user_department'):
-            score_components.append(f"""
-                CASE WHEN metadata->>'department' = %s 
-                THEN {config.department_weight} 
-                ELSE 0.0 END
-            """)
-            params.append(filters['user_department'])
-        
-        # Campus preference bonus  
+            scores += department_match * config.department_weight
+        
+        # Campus preference bonus
         if filters.get('preferred_campus'):
-            score_components.append(f"""
-                CASE WHEN metadata->>'campus' = %s 
-                THEN 0.05 
-                ELSE 0.0 END
-            """)
-            params.append(filters['preferred_campus'])
+            scores += campus_match * 0.05
         
         # Recency bonus for recently updated documents
         if filters.get('recency_bonus'):
-            score_components.append(f"""
-                CASE WHEN (metadata->>'last_reviewed')::timestamp > (NOW() - INTERVAL '90 days')
-                THEN 0.05
-                ELSE 0.0 END
-            """)
+            scores += is_recent * 0.05
         
-        return f"({' + '.join(score_components)})", params
+        return scores
+    
+    def build_search_query(
+        self,
+        query_embedding: np.ndarray,
+        filters: Dict[str, Any],
+        config: QueryConfig,
+        shape: str = 'hnsw'
+    ) -> Tuple[str, List[Any]]:
+        """
+        Assemble the full hybrid search SQL and its parameters.
+        
+        Shared by the sync and async search paths. Parameters are collected
+        in the order their placeholders appear in the SQL text.
+        
+        The SQL text depends only on which filters are set, never on their
+        values or the weights, so each filter shape is prepared once per
+        connection and later calls skip parsing and planning.
+        
+        Rows are candidates with raw scoring features, nearest first.
+        
+        Args:
+            query_embedding: Query vector
+            filters: Filtering criteria
+            config: Query configuration
+            shape: 'hnsw' walks the vector index with every filter applied
+                during the scan (hnsw.iterative_scan keeps it going until
+                enough rows pass); 'filter_first' applies every filter first
+                and ranks the survivors exactly (see choose_query_shape)
+        
+        Returns:
+            Tuple of (SQL string, params)
+        """
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        distance_sql = HALFVEC_DISTANCE if config.use_halfvec else VECTOR_DISTANCE
+        
+        column_conditions, filter_params = self.build_query_conditions(filters, [])
+        tag_conditions, filter_params = self.build_tag_title_conditions(filters, filter_params)
+        conditions = column_conditions + tag_conditions
+        where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        candidate_limit = max(CANDIDATE_LIMIT, config.max_results)
+        
+        # Stage 1 finds the ids of the nearest filtered candidates, computing
+        # each distance once. Stage 2 joins back for the wide columns of just
+        # those rows and returns their raw scoring features. Ranking happens
+        # in rank_rows. Every filter belongs to stage 1, so the candidate
+        # limit counts only rows that match.
+        if shape == 'filter_first':
+            # Every filter runs before the exact distance ranking
+            candidates_sql = f"""
+            WITH filtered AS MATERIALIZED (
+                SELECT id, embedding
+                FROM document_chunks 
+                {where_sql}
+            ),
+            candidates AS MATERIALIZED (
+                SELECT id, {distance_sql} as dist
+                FROM filtered
+                ORDER BY dist
+                LIMIT %s
+            )"""
+            params = filter_params + [query_vector, candidate_limit]
+        else:
+            # Filters run during the HNSW scan
+            candidates_sql = f"""
+            WITH candidates AS MATERIALIZED (
+                SELECT id, {distance_sql} as dist
+                FROM document_chunks 
+                {where_sql}
+                ORDER BY dist
+                LIMIT %s
+            )"""
+            params = [query_vector] + filter_params + [candidate_limit]
+        
+        params.extend([
+            filters.get('user_department'),
+            filters.get('preferred_campus'),
+            filters.get('similarity_threshold', 0.4)
+        ])
+        
+        query_sql = candidates_sql + f"""
+            SELECT 
+                document_title,
+                section_title,
+                text,
+                page_number,
+                metadata,
+                1 - dist as similarity,
+                COALESCE(priority, 0) as priority,
+                COALESCE(view_count, 0) as view_count,
+                COALESCE(department = %s, false) as department_match,
+                COALESCE(campus = %s, false) as campus_match,
+                COALESCE(last_reviewed > NOW() - INTERVAL '90 days', false) as is_recent
+            FROM candidates
+            JOIN document_chunks USING (id)
+            WHERE dist < %s
+            ORDER BY dist
+        """
+        
+        return query_sql, params
+    
+    @staticmethod
+    def _query_shape_key(filters: Dict[str, Any], config: QueryConfig) -> Tuple:
+        """Which filters are set (not their values), plus the index in use."""
+        keys = frozenset(key for key, value in filters.items()
+                         if value and key != 'similarity_threshold')
+        return keys, config.use_halfvec
+    
+    def _plan_cache_stale(self, table_rows: float) -> bool:
+        """True when the table has grown or shrunk enough to re-plan."""
+        if self._plan_cache_rows is None:
+            return True
+        return abs(table_rows - self._plan_cache_rows) > PLAN_CACHE_ROW_DELTA * max(self._plan_cache_rows, 1)
+    
+    def choose_query_shape(
+        self,
+        conn: psycopg.Connection,
+        query_embedding: np.ndarray,
+        filters: Dict[str, Any],
+        config: QueryConfig
+    ) -> str:
+        """
+        Pick the cheapest query shape for this filter combination.
+        
+        The first search with a given set of filters EXPLAINs every shape
+        in QUERY_SHAPES and caches the one with the lowest estimated total
+        cost; later searches with the same filters reuse it. The cache is
+        cleared when the table size changes by more than PLAN_CACHE_ROW_DELTA.
+        """
+        now = time.monotonic()
+        if now - self._plan_cache_checked > PLAN_CACHE_CHECK_INTERVAL:
+            self._plan_cache_checked = now
+            table_rows = conn.execute(TABLE_ROWS_SQL).fetchone()[0]
+            if self._plan_cache_stale(table_rows):
+                self._plan_cache.clear()
+                self._plan_cache_rows = table_rows
+        
+        key = self._query_shape_key(filters, config)
+        shape = self._plan_cache.get(key)
+        if shape is None:
+            costs = {}
+            with conn.cursor() as cur:
+                for candidate in QUERY_SHAPES:
+                    query_sql, params = self.build_search_query(query_embedding, filters, config, candidate)
+                    cur.execute("EXPLAIN (FORMAT JSON) " + query_sql, params)
+                    costs[candidate] = cur.fetchone()[0][0]['Plan']['Total Cost']
+            shape = min(costs, key=costs.get)
+            self._plan_cache[key] = shape
+            logger.info(f"Query shape for filters {sorted(key[0])}: {shape} (costs {costs})")
+        
+        return shape
+    
+    async def achoose_query_shape(
+        self,
+        conn: psycopg.AsyncConnection,
+        query_embedding: np.ndarray,
+        filters: Dict[str, Any],
+        config: QueryConfig
+    ) -> str:
+        """Async counterpart of choose_query_shape, sharing the same cache."""
+        now = time.monotonic()
+        if now - self._plan_cache_checked > PLAN_CACHE_CHECK_INTERVAL:
+            self._plan_cache_checked = now
+            table_rows = (await (await conn.execute(TABLE_ROWS_SQL)).fetchone())[0]
+            if self._plan_cache_stale(table_rows):
+                self._plan_cache.clear()
+                self._plan_cache_rows = table_rows
+        
+        key = self._query_shape_key(filters, config)
+        shape = self._plan_cache.get(key)
+        if shape is None:
+            costs = {}
+            async with conn.cursor() as cur:
+                for candidate in QUERY_SHAPES:
+                    query_sql, params = self.build_search_query(query_embedding, filters, config, candidate)
+                    await cur.execute("EXPLAIN (FORMAT JSON) " + query_sql, params)
+                    costs[candidate] = (await cur.fetchone())[0][0]['Plan']['Total Cost']
+            shape = min(costs, key=costs.get)
+            self._plan_cache[key] = shape
+            logger.info(f"Query shape for filters {sorted(key[0])}: {shape} (costs {costs})")
+        
+        return shape
+    
+    def row_to_result(self, row: Tuple, combined_score: float) -> SearchResult:
+        """Convert one raw candidate row to a SearchResult."""
+        doc_title, section, text, page_num, metadata, similarity = row[:6]
+        
+        return SearchResult(
+            document_title=doc_title,
+            section_title=section,
+            text=text,
+            page_number=page_num or 0,
+            metadata=metadata or {},  # jsonb arrives already decoded
+            similarity=similarity,
+            combined_score=combined_score
+        )
+    
+    def rank_rows(
+        self,
+        rows: List[Tuple],
+        filters: Dict[str, Any],
+        config: QueryConfig
+    ) -> List[SearchResult]:
+        """Score candidate rows and return the top max_results as SearchResults."""
+        if not rows:
+            return []
+        
+        features = np.array([row[5:] for row in rows], dtype=np.float64)
+        scores = self.score_candidates(features, config, filters)
+        top = np.argsort(-scores, kind='stable')[:config.max_results]
+        
+        return [self.row_to_result(rows[i], float(scores[i])) for i in top]
+    
+    def record_stats(
+        self,
+        query: str,
+        filters: Dict[str, Any],
+        results: List[SearchResult],
+        execution_time: float,
+        embedding_time: float,
+        db_time: float,
+        results_count: Optional[int] = None
+    ):
+        """
+        Record statistics for one completed search.
+        
+        Streaming searches pass only their first results (enough for the
+        DRF credit) together with the full results_count.
+        """
+        self._record_drf(query, results)
+        if results_count is None:
+            results_count = len(results)
+        
+        with self._stats_lock:
+            self.stats[self.stats_count % STATS_CAPACITY] = (
+                execution_time, results_count, embedding_time, db_time
+            )
+            self.stats_count += 1
+            self.recent_queries.append(QueryStats(
+                query=query,
+                execution_time=execution_time,
+                results_count=results_count,
+                embedding_time=embedding_time,
+                db_time=db_time,
+                filters_applied=filters
+            ))
+        
+        logger.info(f"Search completed: {results_count} results in {execution_time:.3f}s")
     
     def execute_hybrid_search(
         self,
@@ -287,6 +866,10 @@ class EdinburghHybridSearch:
         """
         Execute comprehensive hybrid search with all features.
         
+        Ranking needs every candidate before the first result is known;
+        for large jobs (admin or recall runs) iter_hybrid_search streams
+        scored results with bounded memory instead.
+        
         Args:
             query: Search query text
             filters: Optional filtering criteria
@@ -313,86 +896,353 @@ class EdinburghHybridSearch:
             query_embedding = self.get_embedding(query)
             embedding_time = time.time() - embed_start
             
-            if not query_embedding:
+            if query_embedding is None or len(query_embedding) == 0:
                 logger.error("Failed to generate query embedding")
                 return []
             
-            filters['_query_embedding'] = query_embedding
-            
-            # Build dynamic query
             with self.get_db_connection() as conn:
-                cur = conn.cursor()
-                
                 db_start = time.time()
                 
-                # Build WHERE conditions
-                params = []
-                where_conditions, params = self.build_query_conditions(filters, params)
+                shape = self.choose_query_shape(conn, query_embedding, filters, config)
+                query_sql, params = self.build_search_query(query_embedding, filters, config, shape)
                 
-                # Build scoring expression
-                scoring_expr, params = self.build_scoring_expression(config, filters, params)
+                with conn.cursor() as cur:
+                    cur.execute(query_sql, params, prepare=True)
+                    rows = cur.fetchall()
                 
-                # Final parameters for LIMIT
-                params.append(config.max_results)
+                db_time = time.time() - db_start
+            
+            results = self.rank_rows(rows, filters, config)
+        
+        except Exception as e:
+            logger.error(f"Hybrid search execution failed: {e}")
+            return []
+        
+        self.record_stats(query, filters, results, time.time() - start_time,
+                          embedding_time, db_time)
+        return results
+    
+    def iter_hybrid_search(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        config: Optional[QueryConfig] = None
+    ) -> Iterator[SearchResult]:
+        """
+        Stream hybrid search results through a server-side cursor.
+        
+        Candidate rows arrive STREAM_ITERSIZE at a time and each batch is
+        scored with NumPy as it arrives, so memory stays bounded however
+        large the candidate set is (e.g. max_results=1000 for admin or
+        recall jobs). Results come nearest first, each with its combined
+        score, rather than in combined-score order; use
+        execute_hybrid_search for a ranked top-N. The pooled connection is
+        held until the generator is exhausted or closed. Unlike
+        execute_hybrid_search, errors are raised to the caller.
+        """
+        start_time = time.time()
+        
+        config = config or QueryConfig()
+        filters = filters or {}
+        filters['similarity_threshold'] = config.similarity_threshold
+        
+        logger.info(f"Streaming hybrid search: '{query[:50]}...'")
+        
+        embed_start = time.time()
+        query_embedding = self.get_embedding(query)
+        embedding_time = time.time() - embed_start
+        
+        nearest = []  # first results, for the DRF credit in record_stats
+        results_count = 0
+        db_time = 0.0
+        
+        with self.get_db_connection() as conn:
+            db_start = time.time()
+            shape = self.choose_query_shape(conn, query_embedding, filters, config)
+            query_sql, params = self.build_search_query(query_embedding, filters, config, shape)
+            
+            with conn.cursor(name='hybrid_search') as cur:
+                cur.execute(query_sql, params)
+                rows = cur.fetchmany(STREAM_ITERSIZE)
+                db_time += time.time() - db_start
                 
-                # Execute the query
-                query_sql = f"""
-                    SELECT 
-                        document_title,
-                        section_title,
-                        text,
-                        page_number,
-                        metadata,
-                        1 - (embedding <=> %s::vector) as similarity,
-                        {scoring_expr} as combined_score
-                    FROM document_chunks 
-                    WHERE {' AND '.join(where_conditions)}
-                    ORDER BY combined_score DESC
-                    LIMIT %s
-                """
+                while rows:
+                    features = np.array([row[5:] for row in rows], dtype=np.float64)
+                    scores = self.score_candidates(features, config, filters)
+                    for row, score in zip(rows, scores):
+                        result = self.row_to_result(row, float(score))
+                        if len(nearest) < DRF_TOP_K:
+                            nearest.append(result)
+                        results_count += 1
+                        yield result
+                    
+                    db_start = time.time()
+                    rows = cur.fetchmany(STREAM_ITERSIZE)
+                    db_time += time.time() - db_start
+        
+        self.record_stats(query, filters, nearest, time.time() - start_time,
+                          embedding_time, db_time, results_count=results_count)
+    
+    @embedding_retry
+    async def _apost_embedding(self, text: str) -> np.ndarray:
+        """One async Ollama embed request; retried by embedding_retry."""
+        response = await self.async_http.post(
+            self.ollama_url,
+            json={
+                'model': 'bge-m3',
+                'input': text
+            }
+        )
+        response.raise_for_status()
+        return np.asarray(orjson.loads(response.content)['embeddings'][0], dtype=np.float32)
+    
+    async def aget_embedding(self, text: str) -> np.ndarray:
+        """Async counterpart of get_embedding, using the shared httpx client."""
+        cached = self._cached_embedding(text)
+        if cached is not None:
+            return cached
+        
+        try:
+            embedding = await self._apost_embedding(text)
+        except Exception as e:
+            logger.error(f"Embedding failed for: {text[:50]}... ({e})")
+            raise
+        
+        self._cache_embedding(text, embedding)
+        return embedding
+    
+    async def aopen_pool(self):
+        """Open the async pool (no-op once open) and wait for its first connections."""
+        if self.async_pool.closed:
+            await self.async_pool.open(wait=True)
+    
+    async def aexecute_hybrid_search(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        config: Optional[QueryConfig] = None
+    ) -> List[SearchResult]:
+        """
+        Async version of execute_hybrid_search.
+        
+        Many concurrent searches share one event loop and one async pool.
+        The embedding request and pool warm-up run concurrently.
+        """
+        start_time = time.time()
+        embedding_time = 0
+        db_time = 0
+        
+        config = config or QueryConfig()
+        filters = filters or {}
+        filters['similarity_threshold'] = config.similarity_threshold
+        
+        logger.info(f"Executing async hybrid search: '{query[:50]}...'")
+        
+        try:
+            embed_start = time.time()
+            query_embedding, _ = await asyncio.gather(
+                self.aget_embedding(query),
+                self.aopen_pool()
+            )
+            embedding_time = time.time() - embed_start
+            
+            if query_embedding is None or len(query_embedding) == 0:
+                logger.error("Failed to generate query embedding")
+                return []
+            
+            async with self.async_pool.connection() as conn:
+                db_start = time.time()
                 
-                # Add query embedding for similarity calculation
-                params.insert(-1, query_embedding)  # Insert before LIMIT parameter
+                shape = await self.achoose_query_shape(conn, query_embedding, filters, config)
+                query_sql, params = self.build_search_query(query_embedding, filters, config, shape)
                 
-                cur.execute(query_sql, params)
-                raw_results = cur.fetchall()
+                async with conn.cursor() as cur:
+                    await cur.execute(query_sql, params, prepare=True)
+                    rows = await cur.fetchall()
                 
                 db_time = time.time() - db_start
+            
+            results = self.rank_rows(rows, filters, config)
+        
+        except Exception as e:
+            logger.error(f"Async hybrid search execution failed: {e}")
+            return []
+        
+        self.record_stats(query, filters, results, time.time() - start_time,
+                          embedding_time, db_time)
+        return results
+    
+    def build_rrf_query(
+        self,
+        query_embedding: np.ndarray,
+        filters: Dict[str, Any],
+        config: QueryConfig
+    ) -> Tuple[str, List[Any]]:
+        """
+        Build the RRF query: one rank column per signal (semantic, priority, recency).
+        
+        The candidates are the RRF_LIST_SIZE nearest chunks that pass the
+        filters, found through the HNSW index; priority and recency are
+        ranked only among those, so an unrelated high-priority chunk can't
+        enter the results and no other row has its distance computed.
+        """
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        distance_sql = HALFVEC_DISTANCE if config.use_halfvec else VECTOR_DISTANCE
+        
+        params = [query_vector]
+        where_conditions, params = self.build_query_conditions(filters, params)
+        tag_conditions, params = self.build_tag_title_conditions(filters, params)
+        where_conditions += tag_conditions
+        params.extend([RRF_LIST_SIZE, filters.get('similarity_threshold', 0.4)])
+        
+        where_sql = f"WHERE {' AND '.join(where_conditions)}" if where_conditions else ""
+        rank_columns = ",\n                ".join(
+            f"ROW_NUMBER() OVER (ORDER BY {ordering}) AS {name}_rank"
+            for name, ordering in RRF_ORDERINGS.items()
+        )
+        
+        query_sql = f"""
+            WITH candidates AS MATERIALIZED (
+                SELECT id, {distance_sql} as dist
+                FROM document_chunks
+                {where_sql}
+                ORDER BY dist
+                LIMIT %s
+            )
+            SELECT
+                id, document_title, section_title, text, page_number, metadata, dist,
+                {rank_columns}
+            FROM candidates
+            JOIN document_chunks USING (id)
+            WHERE dist < %s
+        """
+        
+        return query_sql, params
+    
+    def fuse_rankings(self, rows: List[Tuple], limit: int) -> List[SearchResult]:
+        """
+        Merge the per-signal ranks with Reciprocal Rank Fusion.
+        
+        Each document scores sum(1 / (RRF_K + rank)) over the signals, so no
+        per-signal normalisation or weights are needed.
+        """
+        scored = []
+        for chunk_id, doc_title, section, text, page_num, metadata, dist, *ranks in rows:
+            score = sum(1 / (RRF_K + rank) for rank in ranks)
+            scored.append((score, doc_title, section, text, page_num, metadata, dist))
+        scored.sort(key=lambda row: row[0], reverse=True)
+        
+        return [
+            SearchResult(
+                document_title=doc_title,
+                section_title=section,
+                text=text,
+                page_number=page_num or 0,
+                metadata=metadata or {},
+                similarity=1 - dist,
+                combined_score=score
+            )
+            for score, doc_title, section, text, page_num, metadata, dist in scored[:limit]
+        ]
+    
+    def execute_rrf_search(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        config: Optional[QueryConfig] = None
+    ) -> List[SearchResult]:
+        """
+        Hybrid search ranked by Reciprocal Rank Fusion instead of weights.
+        
+        One query returns the candidates with their semantic, priority and
+        recency ranks; the fusion happens in fuse_rankings.
+        """
+        start_time = time.time()
+        embedding_time = 0
+        db_time = 0
+        
+        config = config or QueryConfig()
+        filters = filters or {}
+        filters['similarity_threshold'] = config.similarity_threshold
+        
+        logger.info(f"Executing RRF search: '{query[:50]}...'")
+        
+        try:
+            embed_start = time.time()
+            query_embedding = self.get_embedding(query)
+            embedding_time = time.time() - embed_start
+            
+            if query_embedding is None or len(query_embedding) == 0:
+                logger.error("Failed to generate query embedding")
+                return []
+            
+            query_sql, params = self.build_rrf_query(query_embedding, filters, config)
+            
+            with self.get_db_connection() as conn:
+                db_start = time.time()
                 
-                # Convert to SearchResult objects
-                results = []
-                for row in raw_results:
-                    (doc_title, section, text, page_num, metadata, 
-                     similarity, combined_score) = row
-                    
-                    results.append(SearchResult(
-                        document_title=doc_title,
-                        section_title=section,
-                        text=text,
-                        page_number=page_num or 0,
-                        metadata=json.loads(metadata) if metadata else {},
-                        similarity=similarity,
-                        combined_score=combined_score
-                    ))
+                with conn.cursor() as cur:
+                    cur.execute(query_sql, params, prepare=True)
+                    rows = cur.fetchall()
                 
-                cur.close()
+                db_time = time.time() - db_start
+            
+            results = self.fuse_rankings(rows, config.max_results)
         
         except Exception as e:
-            logger.error(f"Hybrid search execution failed: {e}")
+            logger.error(f"RRF search execution failed: {e}")
             return []
         
-        # Record statistics
-        execution_time = time.time() - start_time
-        self.stats.append(QueryStats(
-            query=query,
-            execution_time=execution_time,
-            results_count=len(results),
-            embedding_time=embedding_time,
-            db_time=db_time,
-            filters_applied=filters
-        ))
-        
-        logger.info(f"Search completed: {len(results)} results in {execution_time:.3f}s")
+        self.record_stats(query, filters, results, time.time() - start_time,
+                          embedding_time, db_time)
+        return results
+    
+    async def aexecute_rrf_search(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        config: Optional[QueryConfig] = None
+    ) -> List[SearchResult]:
+        """Async RRF search; the embedding request and pool opening overlap."""
+        start_time = time.time()
+        embedding_time = 0
+        db_time = 0
+        
+        config = config or QueryConfig()
+        filters = filters or {}
+        filters['similarity_threshold'] = config.similarity_threshold
+        
+        logger.info(f"Executing async RRF search: '{query[:50]}...'")
+        
+        try:
+            embed_start = time.time()
+            query_embedding, _ = await asyncio.gather(
+                self.aget_embedding(query),
+                self.aopen_pool()
+            )
+            embedding_time = time.time() - embed_start
+            
+            if query_embedding is None or len(query_embedding) == 0:
+                logger.error("Failed to generate query embedding")
+                return []
+            
+            query_sql, params = self.build_rrf_query(query_embedding, filters, config)
+            
+            db_start = time.time()
+            async with self.async_pool.connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(query_sql, params, prepare=True)
+                    rows = await cur.fetchall()
+            db_time = time.time() - db_start
+            
+            results = self.fuse_rankings(rows, config.max_results)
+        
+        except Exception as e:
+            logger.error(f"Async RRF search execution failed: {e}")
+            return []
+        
+        self.record_stats(query, filters, results, time.time() - start_time,
+                          embedding_time, db_time)
         return results
     
     def search_by_department(
@@ -490,33 +1340,57 @@ class EdinburghHybridSearch:
         return self.execute_hybrid_search(query, filters, config)
     
     def get_query_performance_stats(self) -> Dict[str, Any]:
-        """Get aggregated performance statistics."""
+        """
+        Get aggregated performance statistics.
+        
+        Averages and extremes cover the most recent STATS_CAPACITY searches.
+        """
         
-        if not self.stats:
+        with self._stats_lock:
+            total_queries = self.stats_count
+            window = self.stats[:min(total_queries, STATS_CAPACITY)].copy()
+        
+        if not total_queries:
             return {'message': 'No queries executed yet'}
         
-        total_queries = len(self.stats)
-        avg_time = sum(s.execution_time for s in self.stats) / total_queries
-        avg_results = sum(s.results_count for s in self.stats) / total_queries
-        avg_embedding_time = sum(s.embedding_time for s in self.stats) / total_queries
-        avg_db_time = sum(s.db_time for s in self.stats) / total_queries
+        exec_times = window['exec']
         
         return {
             'total_queries': total_queries,
-            'avg_execution_time': round(avg_time, 3),
-            'avg_results_count': round(avg_results, 1),
-            'avg_embedding_time': round(avg_embedding_time, 3),
-            'avg_db_time': round(avg_db_time, 3),
-            'slowest_query_time': max(s.execution_time for s in self.stats),
-            'fastest_query_time': min(s.execution_time for s in self.stats)
+            'avg_execution_time': round(float(exec_times.mean()), 3),
+            'avg_results_count': round(float(window['results'].mean()), 1),
+            'avg_embedding_time': round(float(window['embed'].mean()), 3),
+            'avg_db_time': round(float(window['db'].mean()), 3),
+            'slowest_query_time': float(exec_times.max()),
+            'fastest_query_time': float(exec_times.min())
         }
     
+    def compare_halfvec_recall(self, query: str, k: int = 10) -> float:
+        """
+        A/B check for the halfvec index: fraction of the full-precision
+        top-k neighbours that the half-precision index also returns.
+        """
+        query_vector = self.get_embedding(query)
+        
+        neighbours = []
+        with self.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                for distance_sql in (VECTOR_DISTANCE, HALFVEC_DISTANCE):
+                    cur.execute(
+                        f"SELECT id FROM document_chunks ORDER BY {distance_sql} LIMIT %s",
+                        [query_vector, k]
+                    )
+                    neighbours.append({row[0] for row in cur.fetchall()})
+        
+        full, half = neighbours
+        return len(full & half) / len(full) if full else 1.0
+    
     def explain_query_performance(self, query: str, filters: Optional[Dict[str, Any]] = None):
         """Analyze query execution plan for optimization."""
         
         try:
             query_embedding = self.get_embedding(query)
-            if not query_embedding:
+            if query_embedding is None or len(query_embedding) == 0:
                 return
             
             with self.get_db_connection() as conn:
@@ -527,10 +1401,10 @@ class EdinburghHybridSearch:
                     EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
                     SELECT 
                         document_title,
-                        1 - (embedding <=> %s::vector) as similarity
+                        1 - (embedding <=> %b) as similarity
                     FROM document_chunks 
-                    WHERE embedding <=> %s::vector < 0.4
-                    ORDER BY embedding <=> %s::vector
+                    WHERE embedding <=> %b < 0.4
+                    ORDER BY embedding <=> %b
                     LIMIT 10
                 """
                 
@@ -590,6 +1464,7 @@ def setup_enhanced_database():
     
     import random
     
+    metadata_rows = []
     for chunk_id, doc_title in chunks:
         metadata = {
             'department': random.choice(departments),
@@ -620,21 +1495,100 @@ def setup_enhanced_database():
             metadata['category'] = 'communication'
             metadata['tags'].append('email')
         
-        cur.execute("""
-            UPDATE document_chunks 
-            SET metadata = %s
-            WHERE id = %s
-        """, (json.dumps(metadata), chunk_id))
+        metadata_rows.append((chunk_id, json.dumps(metadata)))
+    
+    # Stream all rows into a temp table with one COPY, instead of one
+    # UPDATE round-trip per chunk
+    cur.execute("""
+        CREATE TEMP TABLE chunk_metadata ON COMMIT DROP AS
+        SELECT id, metadata FROM document_chunks WITH NO DATA
+    """)
+    with cur.copy("COPY chunk_metadata (id, metadata) FROM STDIN") as copy:
+        for row in metadata_rows:
+            copy.write_row(row)
+    
+    # Promote the fields used in filters and scoring to real columns, so
+    # queries compare typed values instead of casting metadata->>'...' per row
+    print("Promoting hot metadata fields to columns...")
+    
+    cur.execute("""
+        ALTER TABLE document_chunks
+            ADD COLUMN IF NOT EXISTS department text,
+            ADD COLUMN IF NOT EXISTS campus text,
+            ADD COLUMN IF NOT EXISTS doc_type text,
+            ADD COLUMN IF NOT EXISTS status text,
+            ADD COLUMN IF NOT EXISTS priority smallint,
+            ADD COLUMN IF NOT EXISTS view_count int,
+            ADD COLUMN IF NOT EXISTS clearance_level smallint,
+            ADD COLUMN IF NOT EXISTS last_reviewed timestamptz
+    """)
+    
+    # Section 8's setup may already have made some of these generated from
+    # metadata (e.g. priority); those follow the metadata write by themselves
+    # and can't be assigned, so they're left out of the UPDATE
+    cur.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = 'document_chunks'::regclass AND attgenerated <> '' AND NOT attisdropped
+    """)
+    generated = {row[0] for row in cur.fetchall()}
+    promoted = {
+        'department': "t.metadata->>'department'",
+        'campus': "t.metadata->>'campus'",
+        'doc_type': "t.metadata->>'doc_type'",
+        'status': "t.metadata->>'status'",
+        'priority': "(t.metadata->>'priority')::smallint",
+        'view_count': "(t.metadata->>'view_count')::int",
+        'clearance_level': "(t.metadata->>'clearance_level')::smallint",
+        'last_reviewed': "(t.metadata->>'last_reviewed')::timestamptz"
+    }
+    assignments = "".join(f",\n            {column} = {expr}"
+                          for column, expr in promoted.items() if column not in generated)
+    
+    # One UPDATE writes the metadata and its promoted columns together
+    cur.execute(f"""
+        UPDATE document_chunks d SET
+            metadata = t.metadata{assignments}
+        FROM chunk_metadata t
+        WHERE d.id = t.id
+    """)
     
     conn.commit()
     
+    # Each index statement commits on its own: one failure (e.g. the halfvec
+    # index on pgvector < 0.7) must not abort the transaction and silently
+    # roll back the indexes already reported as created
+    conn.autocommit = True
+    
     # Create indexes
     print("Creating advanced indexes...")
     
+    preparation = [
+        # title_contains filters with ILIKE '%...%', which a btree index can
+        # never serve; a trigram GIN index can
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "DROP INDEX IF EXISTS document_chunks_title_idx",
+        # Tag filters use @> containment, which jsonb_path_ops indexes more
+        # compactly than the default jsonb_ops
+        "DROP INDEX IF EXISTS document_chunks_metadata_gin"
+    ]
+    
+    # Without the privileges for these (e.g. CREATE on the database), setup
+    # carries on; only the trigram index below then fails
+    for prep_sql in preparation:
+        try:
+            cur.execute(prep_sql)
+        except Exception as e:
+            print(f"  ⚠️ {prep_sql}: {e}")
+    
     indexes = [
-        "CREATE INDEX IF NOT EXISTS document_chunks_metadata_gin ON document_chunks USING gin (metadata)",
-        "CREATE INDEX IF NOT EXISTS document_chunks_title_idx ON document_chunks (document_title)", 
-        "CREATE INDEX IF NOT EXISTS document_chunks_page_idx ON document_chunks (page_number)"
+        "CREATE INDEX IF NOT EXISTS document_chunks_metadata_path_gin ON document_chunks USING gin (metadata jsonb_path_ops)",
+        "CREATE INDEX IF NOT EXISTS document_chunks_title_trgm ON document_chunks USING gin (document_title gin_trgm_ops)", 
+        "CREATE INDEX IF NOT EXISTS document_chunks_page_idx ON document_chunks (page_number)",
+        "CREATE INDEX IF NOT EXISTS document_chunks_active_dept_idx ON document_chunks (department, status) WHERE status = 'active'",
+        "CREATE INDEX IF NOT EXISTS document_chunks_priority_idx ON document_chunks (priority)",
+        "CREATE INDEX IF NOT EXISTS document_chunks_last_reviewed_idx ON document_chunks (last_reviewed)",
+        # Half-precision copy of the HNSW index for QueryConfig(use_halfvec=True)
+        "CREATE INDEX IF NOT EXISTS document_chunks_embedding_half_idx ON document_chunks USING hnsw ((embedding::halfvec(1024)) halfvec_cosine_ops)"
     ]
     
     for idx_sql in indexes:
@@ -644,7 +1598,6 @@ def setup_enhanced_database():
         except Exception as e:
             print(f"  ⚠️ Index creation: {e}")
     
-    conn.commit()
     cur.close()
     conn.close()
     
@@ -783,6 +1736,8 @@ def run_comprehensive_tests():
     print("-" * 40)
     
     search.explain_query_performance("password reset help")
+    
+    search.close()
 
 def demonstrate_edinburgh_scenarios():
     """Demonstrate realistic Edinburgh University usage scenarios."""
@@ -890,6 +1845,8 @@ def demonstrate_edinburgh_scenarios():
         print(f"  {i}. {result.document_title}")
         print(f"     Version: {version} | Last Reviewed: {last_review[:10]}")
         print(f"     Relevance: {result.similarity:.3f}")
+    
+    search.close()
 
 if __name__ == "__main__":
     """
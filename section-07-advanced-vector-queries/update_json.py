@@ -8,15 +8,42 @@ DB_CONFIG = {
   "port": "5050"
 }
 
+# Rows per UPDATE; committing each batch keeps locks and WAL per transaction bounded
+BATCH_SIZE = 10000
+
+# Partial index over exactly the rows still to update, so each batch finds
+# them without rescanning rows that are already done. It empties as the job
+# runs and is dropped at the end.
+with psycopg.connect(**DB_CONFIG, autocommit=True) as conn:
+    conn.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS document_chunks_pending_has_section
+        ON document_chunks (id)
+        WHERE section_title IS NOT NULL AND meta_data->'has_section' IS DISTINCT FROM 'true'::jsonb;
+    """)
+
+total = 0
 with psycopg.connect(**DB_CONFIG) as conn:
     with conn.cursor() as cur:
-        cur.execute("""
-            UPDATE document_chunks 
-            SET meta_data = jsonb_set(
-                COALESCE(meta_data, '{}'::jsonb),
-                '{has_section}',
-                'true'::jsonb
-            )
-            WHERE section_title IS NOT NULL;
-        """)
-        conn.commit()
+        # || merges the key in without a path lookup. The filter matches every
+        # row not yet set to true (missing, false or anything else) and skips
+        # rows already done, so the job can be stopped and re-run
+        while True:
+            cur.execute("""
+                UPDATE document_chunks
+                SET meta_data = COALESCE(meta_data, '{}'::jsonb) || '{"has_section": true}'::jsonb
+                WHERE id IN (
+                    SELECT id FROM document_chunks
+                    WHERE section_title IS NOT NULL
+                      AND meta_data->'has_section' IS DISTINCT FROM 'true'::jsonb
+                    LIMIT %s
+                );
+            """, (BATCH_SIZE,))
+            conn.commit()
+            total += cur.rowcount
+            if cur.rowcount < BATCH_SIZE:
+                break
+
+with psycopg.connect(**DB_CONFIG, autocommit=True) as conn:
+    conn.execute("DROP INDEX CONCURRENTLY IF EXISTS document_chunks_pending_has_section;")
+
+print(f"Updated {total} rows")
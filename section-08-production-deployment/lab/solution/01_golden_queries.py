@@ -4,8 +4,10 @@
 from typing import List, Dict
 import sys
 import os
-sys.path.append(os.path.dirname(__file__))
-from common import get_rag_pipeline
+import time
+if os.path.dirname(__file__) not in sys.path:
+    sys.path.append(os.path.dirname(__file__))
+from common import get_rag_pipeline, prefetch_query_embeddings, run_queries_concurrently
 
 golden_set: List[Dict[str, str]] = [
     {"query": "What are the library opening hours?", "expected": "The library is open"},
@@ -22,7 +24,15 @@ def run():
     rag = get_rag_pipeline()
     total_queries = len(golden_set)
     
-    for i, item in enumerate(golden_set, 1):
+    # Embed the whole set in one batch request, then run every query up
+    # front, concurrently; results print in order below
+    start_time = time.time()
+    queries = [item["query"] for item in golden_set]
+    prefetch_query_embeddings(queries)
+    results = run_queries_concurrently(rag, queries)
+    elapsed = time.time() - start_time
+    
+    for i, (item, (response, error)) in enumerate(zip(golden_set, results), 1):
         q = item["query"]
         expected_hint = item["expected"]
         
@@ -31,13 +41,14 @@ def run():
         print("-" * 60)
         
         try:
-            response = rag(q)
+            if error is not None:
+                raise error
             
             # Handle RAGResponse object
             if hasattr(response, 'answer'):
                 answer = response.answer
                 confidence = getattr(response, 'confidence_level', 'unknown')
-                chunks_found = getattr(response, 'chunks_found' 0)
+                chunks_found = getattr(response, 'chunks_found', 0)
                 response_time = getattr(response, 'response_time', 0)
                 success = getattr(response, 'success', False)
                 
@@ -64,7 +75,7 @@ def run():
         
         print("="*80)
     
-    print(f"\n🎯 Evaluation complete! Tested {total_queries} golden queries.")
+    print(f"\n🎯 Evaluation complete! Tested {total_queries} golden queries in {elapsed:.2f}s.")
     print("💡 Look for patterns in what works well and what needs improvement.")
 
 if __name__ == "__main__":
@@ -1,11 +1,16 @@
 # 02_simple_scoring.py
 # Exercise 2: Lightweight pass/fail scoring (no external libs).
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+import re
 import sys
 import os
-sys.path.append(os.path.dirname(__file__))
-from common import get_rag_pipeline
+import time
+import numpy as np
+if os.path.dirname(__file__) not in sys.path:
+    sys.path.append(os.path.dirname(__file__))
+from common import get_rag_pipeline, prefetch_query_embeddings, run_queries_concurrently, run_queries_cached
 
 golden_set: List[Dict[str, str]] = [
     {"query": "What are the library opening hours?", "expected": "hours"},
@@ -15,6 +20,18 @@ golden_set: List[Dict[str, str]] = [
     {"query": "How do I access VPN?", "expected": "VPN"},
 ]
 
+@lru_cache(maxsize=None)
+def hint_pattern(expected_hint: str) -> Optional[re.Pattern]:
+    """
+    Compile the hint's keyword tokens into one alternation regex, once per hint
+    Checking an answer is then a single regex search instead of one
+    substring scan per token. Duplicate tokens are dropped and longer
+    tokens go first, so the alternation has no redundant branches.
+    IGNORECASE matches in place, without a lowercased copy of every answer
+    """
+    tokens = sorted({t.lower() for t in expected_hint.split()}, key=len, reverse=True)
+    return re.compile("|".join(map(re.escape, tokens)), re.IGNORECASE) if tokens else None
+
 def simple_eval(response: Any, expected_hint: str) -> str:
     """
     Heuristic: pass if any keyword token from expected_hint appears in result.
@@ -26,16 +43,16 @@ def simple_eval(response: Any, expected_hint: str) -> str:
     else:
         result_text = str(response)
     
-    tokens = [t.strip().lower() for t in expected_hint.split() if t.strip()]
-    rlow = result_text.lower()
-    return "pass" if any(t in rlow for t in tokens) else "fail"
+    pattern = hint_pattern(expected_hint)
+    return "pass" if pattern and pattern.search(result_text) else "fail"
 
-def detailed_eval(response: Any, expected_hint: str) -> Dict[str, Any]:
+def detailed_eval(response: Any, expected_hint: str, basic_eval: Optional[str] = None) -> Dict[str, Any]:
     """
     More detailed evaluation including confidence and other metrics
+    Pass basic_eval when the pass/fail verdict is already known
     """
     result = {
-        "basic_eval": simple_eval(response, expected_hint),
+        "basic_eval": basic_eval or simple_eval(response, expected_hint),
         "has_answer": False,
         "confidence": "unknown",
         "chunks_found": 0,
@@ -54,27 +71,64 @@ def detailed_eval(response: Any, expected_hint: str) -> Dict[str, Any]:
     
     return result
 
+def score_responses(results: List[tuple], items: List[Dict[str, str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score every collected (response, error) pair in one pass, once all
+    queries have finished
+    Returns (verdicts, response_times): errors are a fail with a NaN time
+    """
+    verdicts = np.fromiter(
+        (error is None and simple_eval(response, item["expected"]) == "pass"
+         for item, (response, error) in zip(items, results)),
+        dtype=bool, count=len(results))
+    response_times = np.fromiter(
+        (getattr(response, 'response_time', np.nan) if error is None else np.nan
+         for response, error in results),
+        dtype=float, count=len(results))
+    return verdicts, response_times
+
 def run():
     print("📊 SIMPLE SCORING EVALUATION")
     print("="*80)
     
     rag = get_rag_pipeline()
-    passes = 0
     total_queries = len(golden_set)
     
     print(f"Testing {total_queries} queries with simple pass/fail scoring...")
     print()
     
-    for i, item in enumerate(golden_set, 1):
+    # Compile every hint's matcher before the clock starts
+    for item in golden_set:
+        hint_pattern(item["expected"])
+    
+    # Embed the whole set in one batch request, then run every query up
+    # front, concurrently; results print in order below. Unless --fresh is
+    # given, answers from an earlier run against the same corpus are reused.
+    start_time = time.time()
+    queries = [item["query"] for item in golden_set]
+    if "--fresh" in sys.argv:
+        prefetch_query_embeddings(queries)
+        results = run_queries_concurrently(rag, queries)
+        from_cache = np.zeros(len(queries), dtype=bool)
+    else:
+        results, from_cache = run_queries_cached(rag, queries)
+        from_cache = np.array(from_cache, dtype=bool)
+    elapsed = time.time() - start_time
+    
+    verdicts, response_times = score_responses(results, golden_set)
+    # A reused answer's response_time was measured on an earlier run, so it's
+    # left out of this run's latency percentiles
+    response_times[from_cache] = np.nan
+    
+    for i, (item, (response, error)) in enumerate(zip(golden_set, results), 1):
         q = item["query"]
         expected_hint = item["expected"]
         
         try:
-            response = rag(q)
-            eval_result = detailed_eval(response, expected_hint)
-            verdict = eval_result["basic_eval"]
-            
-            passes += int(verdict == "pass")
+            if error is not None:
+                raise error
+            verdict = "pass" if verdicts[i - 1] else "fail"
+            eval_result = detailed_eval(response, expected_hint, basic_eval=verdict)
             
             # Display results
             status_emoji = "✅" if verdict == "pass" else "❌"
@@ -84,7 +138,8 @@ def run():
                 print(f"   📝 Answer: {response.answer[:100]}{'...' if len(response.answer) > 100 else ''}")
                 print(f"   📊 Confidence: {eval_result['confidence']}")
                 print(f"   🔍 Chunks: {eval_result['chunks_found']}")
-                print(f"   ⏱️  Time: {eval_result['response_time']:.2f}s")
+                cache_note = " (cached answer, earlier run)" if from_cache[i - 1] else ""
+                print(f"   ⏱️  Time: {eval_result['response_time']:.2f}s{cache_note}")
             else:
                 print(f"   📝 Answer: {str(response)[:100]}{'...' if len(str(response)) > 100 else ''}")
             
@@ -96,9 +151,14 @@ def run():
             print()
     
     # Summary
-    pass_rate = (passes / total_queries) * 100
+    passes = int(verdicts.sum())
+    pass_rate = verdicts.mean() * 100
     print("="*80)
     print(f"📈 SUMMARY: {passes}/{total_queries} passed ({pass_rate:.1f}%)")
+    print(f"⏱️  Ran {total_queries} queries in {elapsed:.2f}s ({int(from_cache.sum())} answers reused from .eval_cache)")
+    if not np.isnan(response_times).all():
+        p50, p95, p99 = np.nanpercentile(response_times, [50, 95, 99])
+        print(f"⏱️  Response time p50 {p50:.2f}s | p95 {p95:.2f}s | p99 {p99:.2f}s")
     
     if pass_rate >= 80:
         print("🎉 Excellent performance! Your RAG system is working well.")
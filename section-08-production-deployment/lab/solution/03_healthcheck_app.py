@@ -3,137 +3,166 @@
 # Run: python 03_healthcheck_app.py
 
 import time
-from flask import Flask, jsonify
+import threading
+from functools import partial
+from typing import Dict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from flask import Flask, jsonify, request
+import numpy as np
 import sys
 import os
-sys.path.append(os.path.dirname(__file__))
-from common import check_database_health, check_embedding_health, check_rag_pipeline_health, get_rag_pipeline
+if os.path.dirname(__file__) not in sys.path:
+    sys.path.append(os.path.dirname(__file__))
+from common import get_rag_pipeline, get_health_conn, embed_texts, ensure_health_index, warmup, ttl_cache, HEALTH_CACHE_TTL, PROBE_HTTP_TIMEOUT
 
 app = Flask(__name__)
 
+# For the uptime reported by the liveness check
+STARTED_AT = time.monotonic()
+
+# Longest a health request waits for each probe, in seconds; anything slower
+# is reported unhealthy. The pipeline probe makes a real LLM call, so it gets
+# longer. A request takes at most the largest of these.
+PROBE_TIMEOUTS = {"database": 1.0, "embedding": 1.0, "pipeline": 5.0}
+
+# The component probes are independent and mostly wait on the network, so
+# they run side by side: a check takes as long as its slowest component.
+# Each component has its own worker, so a slow LLM call can never leave the
+# database or embedding probes queued past their deadlines.
+probe_executors = {name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"probe-{name}")
+                   for name in PROBE_TIMEOUTS}
+
+# The latest probe run per component. While one is still going (a hung LLM
+# call, say), later requests wait on that run instead of queueing another,
+# so threads and LLM calls can't pile up behind it.
+in_flight: Dict[str, Future] = {}
+in_flight_lock = threading.Lock()
+
+def submit_probe(name: str, fn) -> Future:
+    """Start a probe for this component, or return its run still in progress"""
+    with in_flight_lock:
+        future = in_flight.get(name)
+        if future is None or future.done():
+            future = in_flight[name] = probe_executors[name].submit(fn)
+        return future
+
+def run_probes(probes: dict, on_failure) -> dict:
+    """Run named probes concurrently; a probe that fails or overruns gets on_failure(error)"""
+    start = time.monotonic()
+    futures = {name: submit_probe(name, fn) for name, fn in probes.items()}
+    
+    results = {}
+    for name, future in futures.items():
+        # Each deadline counts from submission, so waiting on one probe
+        # doesn't use up another's time
+        remaining = max(0.0, start + PROBE_TIMEOUTS[name] - time.monotonic())
+        try:
+            results[name] = future.result(timeout=remaining)
+        except TimeoutError:
+            results[name] = on_failure("timeout")
+        except Exception as e:
+            results[name] = on_failure(str(e))
+    return results
+
 @app.route("/health")
 def health():
-    """Comprehensive health check for the RAG system"""
-    start_time = time.time()
-    
-    # Individual component checks
-    db_ok = check_database_health()
-    embedding_ok = check_embedding_health()
-    pipeline_ok = check_rag_pipeline_health()
-    
-    # Calculate overall status
-    all_healthy = db_ok and embedding_ok and pipeline_ok
-    status = "healthy" if all_healthy else "degraded"
-    
-    # Calculate response time
-    response_time_ms = int((time.time() - start_time) * 1000)
-    
-    # Prepare response
-    health_data = {
-        "status": status,
+    """
+    Liveness check: the process is up and serving requests
+    No database, Ollama or pipeline calls, so it stays fast and a slow
+    dependency can't get a working process restarted. Dependencies are
+    checked by /health/detailed (the readiness check)
+    """
+    return jsonify({
+        "status": "alive",
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "latency_ms": response_time_ms,
-        "checks": {
-            "database": {
-                "status": "healthy" if db_ok else "unhealthy",
-                "description": "PostgreSQL connection and data availability"
-            },
-            "embedding": {
-                "status": "healthy" if embedding_ok else "unhealthy", 
-                "description": "Ollama embedding service"
-            },
-            "pipeline": {
-                "status": "healthy" if pipeline_ok else "unhealthy",
-                "description": "Complete RAG pipeline functionality"
-            }
-        }
-    }
-    
-    # Add detailed diagnostics if any component is unhealthy
-    if not all_healthy:
-        health_data["diagnostics"] = []
-        
-        if not db_ok:
-            health_data["diagnostics"].append("Database connection failed or no embeddings found")
-        
-        if not embedding_ok:
-            health_data["diagnostics"].append("Embedding service unavailable or returning invalid results")
-            
-        if not pipeline_ok:
-            health_data["diagnostics"].append("RAG pipeline failed to process test query")
-    
-    return jsonify(health_data)
+        "pid": os.getpid(),
+        "uptime_s": int(time.monotonic() - STARTED_AT),
+    })
 
-@app.route("/health/detailed")
-def detailed_health():
-    """Detailed health check with more information"""
-    start_time = time.time()
-    
+@ttl_cache(HEALTH_CACHE_TTL)
+def probe_database() -> dict:
+    """Database check with an estimate of the table size"""
     try:
-        # Test database with more details
-        from common import get_conn
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM document_chunks WHERE embedding IS NOT NULL;")
-            chunk_count = cur.fetchone()[0]
-            db_ok = chunk_count > 0
+        # Both queries cost the same however large the table gets: EXISTS stops
+        # at the first embedded row (found via the partial index from
+        # ensure_health_index()), and reltuples is the planner's row estimate
+        with get_health_conn() as conn, conn.cursor() as cur:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM document_chunks WHERE embedding IS NOT NULL);")
+            has_embeddings = cur.fetchone()[0]
+            cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'document_chunks'::regclass;")
+            chunks_estimate = max(cur.fetchone()[0], 0)
+        return {"ok": has_embeddings, "has_embeddings": has_embeddings, "chunks_estimate": chunks_estimate, "error": None}
     except Exception as e:
-        db_ok = False
-        db_error = str(e)
-        chunk_count = 0
-    else:
-        db_error = None
-    
-    # Test embedding with details
+        return {"ok": False, "has_embeddings": False, "chunks_estimate": 0, "error": str(e)}
+
+@ttl_cache(HEALTH_CACHE_TTL)
+def probe_embedding() -> dict:
+    """Embedding check with the returned dimensions"""
     try:
-        from common import embed_text
-        embedding = embed_text("healthcheck test")
-        embedding_ok = isinstance(embedding, list) and len(embedding) == 1024
-        embedding_dims = len(embedding) if embedding else 0
+        embedding = embed_texts(["healthcheck test"], timeout=PROBE_HTTP_TIMEOUT, max_retries=1)[0]
+        embedding_ok = isinstance(embedding, np.ndarray) and embedding.shape == (1024,)
+        return {"ok": embedding_ok, "dimensions": embedding.shape[0], "error": None}
     except Exception as e:
-        embedding_ok = False
-        embedding_error = str(e)
-        embedding_dims = 0
-    else:
-        embedding_error = None
-    
-    # Test pipeline with details
+        return {"ok": False, "dimensions": 0, "error": str(e)}
+
+@ttl_cache(HEALTH_CACHE_TTL)
+def probe_pipeline() -> dict:
+    """Pipeline check with the answer's confidence level"""
     try:
         rag = get_rag_pipeline()
         response = rag("What are the library opening hours?")
         pipeline_ok = hasattr(response, 'success') and response.success
-        if hasattr(response, 'confidence_level'):
-            confidence = response.confidence_level
-        else:
-            confidence = "unknown"
+        confidence = getattr(response, 'confidence_level', "unknown")
+        return {"ok": pipeline_ok, "confidence": confidence, "error": None}
     except Exception as e:
-        pipeline_ok = False
-        pipeline_error = str(e)
-        confidence = "error"
-    else:
-        pipeline_error = None
+        return {"ok": False, "confidence": "error", "error": str(e)}
+
+@app.route("/health/detailed")
+def detailed_health():
+    """
+    Readiness check: every dependency with details
+    Returns 503 while degraded, so a load balancer or orchestrator stops
+    routing traffic here until it recovers
+    """
+    start_time = time.time()
+    
+    # Probe results are cached for a few seconds; operators can force a re-check with ?fresh=1
+    fresh = request.args.get("fresh") == "1"
+    
+    # Run the three probes concurrently
+    probes = run_probes({
+        "database": partial(probe_database, fresh=fresh),
+        "embedding": partial(probe_embedding, fresh=fresh),
+        "pipeline": partial(probe_pipeline, fresh=fresh),
+    }, on_failure=lambda error: {"ok": False, "error": error})
+    db = probes["database"]
+    embedding = probes["embedding"]
+    pipeline = probes["pipeline"]
     
     response_time_ms = int((time.time() - start_time) * 1000)
+    all_healthy = all([db["ok"], embedding["ok"], pipeline["ok"]])
     
     return jsonify({
-        "status": "healthy" if all([db_ok, embedding_ok, pipeline_ok]) else "degraded",
+        "status": "healthy" if all_healthy else "degraded",
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
         "latency_ms": response_time_ms,
         "database": {
-            "status": "healthy" if db_ok else "unhealthy",
-            "chunks_available": chunk_count,
-            "error": db_error
+            "status": "healthy" if db["ok"] else "unhealthy",
+            "has_embeddings": db.get("has_embeddings", False),
+            "chunks_estimate": db.get("chunks_estimate", 0),
+            "error": db["error"]
         },
         "embedding": {
-            "status": "healthy" if embedding_ok else "unhealthy",
-            "dimensions": embedding_dims,
-            "error": embedding_error
+            "status": "healthy" if embedding["ok"] else "unhealthy",
+            "dimensions": embedding.get("dimensions", 0),
+            "error": embedding["error"]
         },
         "pipeline": {
-            "status": "healthy" if pipeline_ok else "unhealthy",
-            "confidence": confidence,
-            "error": pipeline_error
+            "status": "healthy" if pipeline["ok"] else "unhealthy",
+            "confidence": pipeline.get("confidence", "unknown"),
+            "error": pipeline["error"]
         }
-    })
+    }), 200 if all_healthy else 503
 
 @app.route("/")
 def index():
@@ -142,14 +171,29 @@ def index():
     <h1>RAG System Health Check</h1>
     <p>This service provides health monitoring for the RAG pipeline.</p>
     <ul>
-        <li><a href="/health">Basic Health Check</a></li>
-        <li><a href="/health/detailed">Detailed Health Check</a></li>
+        <li><a href="/health">Liveness Check</a></li>
+        <li><a href="/health/detailed">Readiness Check (all components)</a></li>
     </ul>
     """
 
 if __name__ == "__main__":
     print("🏥 Starting RAG Health Check Service...")
-    print("   Basic health: http://localhost:8010/health")
-    print("   Detailed health: http://localhost:8010/health/detailed")
+    print("   Liveness: http://localhost:8010/health")
+    print("   Readiness: http://localhost:8010/health/detailed")
     print("   Press Ctrl+C to stop")
-    app.run(host='0.0.0.0', port=8010, debug=True)
+    try:
+        ensure_health_index()
+    except Exception as e:
+        print(f"⚠️  Could not create health-check index: {e}")
+    try:
+        warmup()
+    except Exception as e:
+        print(f"⚠️  Warmup failed: {e}")
+    if "--dev" in sys.argv:
+        # Flask dev server: reloader and debugger, for working on the app itself
+        app.run(host='0.0.0.0', port=8010, debug=True)
+    else:
+        # Production WSGI server: a thread pool, so concurrent probes from
+        # several load balancers don't queue behind each other
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=8010, threads=8)
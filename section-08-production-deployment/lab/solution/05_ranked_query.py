@@ -6,8 +6,169 @@ import sys
 import json
 import os
 from typing import List, Dict, Any
-sys.path.append(os.path.dirname(__file__))
-from common import embed_text, get_conn
+import numpy as np
+if os.path.dirname(__file__) not in sys.path:
+    sys.path.append(os.path.dirname(__file__))
+from common import embed_text, get_conn, normalize_query, ensure_hnsw_index, ensure_binary_index, ensure_ranking_columns, HNSW_PARAMS
+
+# Stage 1 pulls this many nearest neighbours from the HNSW index; stage 2
+# re-ranks only these rows by the weighted score. hnsw.ef_search must be at
+# least as large as the index stage's LIMIT, or it returns fewer rows.
+CANDIDATE_LIMIT = 200
+
+# With the binary prefilter, stage 1 first takes COARSE_LIMIT rows by Hamming
+# distance between sign-bit quantized embeddings (1024 bits = 128 bytes per
+# row, compared with popcount) and computes full cosine distance only for
+# those. Set to False to search the float HNSW index directly.
+BINARY_PREFILTER = True
+COARSE_LIMIT = 500
+
+# Ordering by the raw distance operator lets the candidates CTE use the
+# HNSW index; ordering by final_score alone would force a full scan.
+# The candidate stages carry only narrow columns: text, titles and metadata
+# are joined in after the final LIMIT, so only the top rows read (and
+# detoast) their text instead of all 200 candidates.
+HNSW_CANDIDATES_CTE = """
+candidates AS (
+  SELECT
+    id,
+    priority,
+    relevance,
+    embedding <=> %(vec)s::vector AS distance
+  FROM document_chunks
+  WHERE embedding IS NOT NULL
+  ORDER BY embedding <=> %(vec)s::vector
+  LIMIT %(candidates)s
+)"""
+
+# The coarse CTE matches the expression index from ensure_binary_index()
+BINARY_CANDIDATES_CTE = """
+coarse AS (
+  SELECT id
+  FROM document_chunks
+  WHERE embedding IS NOT NULL
+  ORDER BY binary_quantize(embedding)::bit(1024) <~> binary_quantize(%(vec)s::vector)
+  LIMIT %(coarse)s
+),
+candidates AS (
+  SELECT
+    id,
+    priority,
+    relevance,
+    embedding <=> %(vec)s::vector AS distance
+  FROM document_chunks JOIN coarse USING (id)
+  ORDER BY distance
+  LIMIT %(candidates)s
+)"""
+
+SCORED_CTE = """
+scored AS (
+  SELECT
+    id,
+    1 - distance AS similarity,
+    COALESCE(priority, 0) AS priority,
+    COALESCE(relevance, 0.5) AS relevance
+  FROM candidates
+)
+"""
+
+# Wide columns for the surviving rows, joined in last
+DETAIL_COLUMNS = """
+    d.document_title,
+    d.page_number,
+    d.section_title,
+    LEFT(d.text, 160) AS preview"""
+LAST_UPDATED_COLUMN = "COALESCE(d.metadata->>'last_updated', 'unknown') AS last_updated"
+
+CANDIDATES_CTE = BINARY_CANDIDATES_CTE if BINARY_PREFILTER else HNSW_CANDIDATES_CTE
+SCORED_CANDIDATES_SQL = "WITH" + CANDIDATES_CTE + "," + SCORED_CTE
+
+# Reciprocal Rank Fusion constant: score = sum of 1 / (RRF_K + rank) over the
+# rankings. Ranks are scale-free, so no weights need tuning.
+RRF_K = 60
+
+# Similarity and priority are ranked independently over the same candidates
+# and fused. Priority is ranked among the semantic candidates rather than the
+# whole table, so a high-priority but unrelated chunk can't enter the results.
+RRF_SQL = "WITH" + CANDIDATES_CTE + """,
+ranked AS (
+  SELECT
+    id,
+    1 - distance AS similarity,
+    COALESCE(priority, 0) AS priority,
+    RANK() OVER (ORDER BY distance) AS sim_rank,
+    RANK() OVER (ORDER BY COALESCE(priority, 0) DESC) AS priority_rank
+  FROM candidates
+),
+top AS (
+  SELECT
+    *,
+    1.0 / (%(k)s + sim_rank) + 1.0 / (%(k)s + priority_rank) AS rrf_score
+  FROM ranked
+  ORDER BY rrf_score DESC
+  LIMIT %(limit)s
+)
+SELECT
+  t.id,""" + DETAIL_COLUMNS + """,
+  ROUND(t.similarity::numeric, 4) AS similarity,
+  t.priority,
+  t.sim_rank,
+  t.priority_rank,
+  ROUND(t.rrf_score::numeric, 5) AS rrf_score
+FROM top t JOIN document_chunks d USING (id)
+ORDER BY t.rrf_score DESC;
+"""
+
+def execute_candidates_query(sql: str, params: Dict[str, Any]) -> List[tuple]:
+    """
+    Run a query built on SCORED_CANDIDATES_SQL with ef_search wide enough
+    for the index stage (transaction-local, so the pooled connection goes
+    back with its usual setting)
+    Both statements are prepared: repeated calls with different vectors or
+    weights skip parsing and planning, and application_name 'rag-rank'
+    makes them easy to find in pg_stat_activity
+    """
+    index_limit = COARSE_LIMIT if BINARY_PREFILTER else CANDIDATE_LIMIT
+    with get_conn() as conn, conn.cursor() as cur:
+        ef_search = max(index_limit, HNSW_PARAMS.get("ef_search", 0))
+        cur.execute(
+            "SELECT set_config('hnsw.ef_search', %s, true), set_config('application_name', 'rag-rank', true);",
+            (str(ef_search),),
+            prepare=True,
+        )
+        cur.execute(sql, {"candidates": CANDIDATE_LIMIT, "coarse": COARSE_LIMIT, **params}, prepare=True)
+        return cur.fetchall()
+
+def print_ranked_rows(rows: List[tuple]):
+    """
+    Display ranked rows: (id, title, page, section, preview, similarity,
+    priority, relevance, final_score, last_updated)
+    """
+    if not rows:
+        print("❌ No results found")
+        return
+    
+    print(f"✅ Found {len(rows)} results:")
+    print()
+    
+    for i, row in enumerate(rows, 1):
+        (id, doc_title, page_num, section, preview, similarity, 
+         priority, relevance, final_score, last_updated) = row
+        
+        print(f"🏆 Rank {i} (Score: {final_score})")
+        print(f"   📄 Document: {doc_title}")
+        if page_num:
+            print(f"   📖 Page: {page_num}")
+        if section:
+            print(f"   📑 Section: {section}")
+        print(f"   📝 Preview: {preview}...")
+        print(f"   📊 Metrics:")
+        print(f"      • Similarity: {similarity}")
+        print(f"      • Priority: {priority}")
+        print(f"      • Relevance: {relevance}")
+        if last_updated != 'unknown':
+            print(f"      • Updated: {last_updated}")
+        print()
 
 def run_ranked_query(query_text: str, sim_weight: float = 0.8, priority_weight: float = 0.2, limit: int = 10):
     """
@@ -20,76 +181,42 @@ def run_ranked_query(query_text: str, sim_weight: float = 0.8, priority_weight:
     try:
         # Generate embedding
         print("🔄 Generating embedding...")
-        vec: List[float] = embed_text(query_text)
-        vec_literal = "'" + "[" + ",".join(f"{x:.7f}" for x in vec) + "]" + "'"
+        vec = embed_text(query_text)
         print(f"✅ Generated {len(vec)}-dimensional embedding")
 
-        # Query using the correct schema from lab6_rag_pipeline.py
-        sql = f"""
-        WITH scored AS (
+        # Query using the correct schema from lab6_rag_pipeline.py.
+        # The embedding and weights are bound parameters, so every call
+        # sends the same SQL text and reuses one prepared plan.
+        sql = SCORED_CANDIDATES_SQL + """,
+        top AS (
           SELECT
-            id,
-            text,
-            document_title,
-            page_number,
-            section_title,
-            LEFT(text, 160) AS preview,
-            1 - (embedding <=> {vec_literal}::vector) AS similarity,
-            COALESCE((metadata->>'priority')::int, 0) AS priority,
-            COALESCE((metadata->>'relevance')::float, 0.5) AS relevance,
-            COALESCE((metadata->>'last_updated')::text, 'unknown') AS last_updated
-          FROM document_chunks
-          WHERE embedding IS NOT NULL
+            *,
+            similarity * %(sim_weight)s + priority * %(priority_weight)s + relevance * 0.1 AS final_score
+          FROM scored
+          ORDER BY final_score DESC
+          LIMIT %(limit)s
         )
         SELECT
-          id,
-          document_title,
-          page_number,
-          section_title,
-          preview,
-          ROUND(similarity::numeric, 4) AS similarity,
-          priority,
-          ROUND(relevance::numeric, 4) AS relevance,
-          ROUND((similarity * {sim_weight} + priority * {priority_weight} + relevance * 0.1)::numeric, 4) AS final_score,
-          last_updated
-        FROM scored
-        ORDER BY final_score DESC
-        LIMIT {limit};
+          t.id,""" + DETAIL_COLUMNS + """,
+          ROUND(t.similarity::numeric, 4) AS similarity,
+          t.priority,
+          ROUND(t.relevance::numeric, 4) AS relevance,
+          ROUND(t.final_score::numeric, 4) AS final_score,
+          """ + LAST_UPDATED_COLUMN + """
+        FROM top t JOIN document_chunks d USING (id)
+        ORDER BY t.final_score DESC;
         """
+        params = {
+            "vec": vec,
+            "sim_weight": sim_weight,
+            "priority_weight": priority_weight,
+            "limit": limit,
+        }
 
         print("\n📋 Executing ranked query...")
         print("-" * 40)
 
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql)
-            rows = cur.fetchall()
-            
-            if not rows:
-                print("❌ No results found")
-                return
-            
-            # Display results
-            print(f"✅ Found {len(rows)} results:")
-            print()
-            
-            for i, row in enumerate(rows, 1):
-                (id, doc_title, page_num, section, preview, similarity, 
-                 priority, relevance, final_score, last_updated) = row
-                
-                print(f"🏆 Rank {i} (Score: {final_score})")
-                print(f"   📄 Document: {doc_title}")
-                if page_num:
-                    print(f"   📖 Page: {page_num}")
-                if section:
-                    print(f"   📑 Section: {section}")
-                print(f"   📝 Preview: {preview}...")
-                print(f"   📊 Metrics:")
-                print(f"      • Similarity: {similarity}")
-                print(f"      • Priority: {priority}")
-                print(f"      • Relevance: {relevance}")
-                if last_updated != 'unknown':
-                    print(f"      • Updated: {last_updated}")
-                print()
+        print_ranked_rows(execute_candidates_query(sql, params))
 
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -98,6 +225,72 @@ def run_ranked_query(query_text: str, sim_weight: float = 0.8, priority_weight:
         print("  • Check that document_chunks table exists with embeddings")
         print("  • Verify that metadata column exists (JSONB)")
 
+def fetch_candidates(query_vec: np.ndarray) -> List[tuple]:
+    """
+    Fetch the nearest CANDIDATE_LIMIT chunks once, unweighted, so several
+    ranking strategies can re-sort the same rows without another query
+    """
+    sql = SCORED_CANDIDATES_SQL + """
+    SELECT
+      s.id,""" + DETAIL_COLUMNS + """,
+      s.similarity,
+      s.priority,
+      s.relevance,
+      """ + LAST_UPDATED_COLUMN + """
+    FROM scored s JOIN document_chunks d USING (id);
+    """
+    return execute_candidates_query(sql, {"vec": query_vec})
+
+def rank_candidates(candidates: List[tuple], sim_weight: float, priority_weight: float, limit: int = 10) -> List[tuple]:
+    """
+    Apply the weighted score in Python and return the top rows in the same
+    shape as run_ranked_query's SQL output
+    """
+    ranked = []
+    for (id, doc_title, page_num, section, preview, similarity,
+         priority, relevance, last_updated) in candidates:
+        final_score = similarity * sim_weight + priority * priority_weight + relevance * 0.1
+        ranked.append((id, doc_title, page_num, section, preview, round(similarity, 4),
+                       priority, round(relevance, 4), round(final_score, 4), last_updated))
+    ranked.sort(key=lambda row: row[8], reverse=True)
+    return ranked[:limit]
+
+def run_rrf_query(query_text: str, limit: int = 10):
+    """
+    Rank by Reciprocal Rank Fusion of similarity rank and priority rank
+    """
+    print(f"🔍 RRF RANKED QUERY: '{query_text}'")
+    print(f"📊 Fusing similarity and priority ranks (k={RRF_K})")
+    print("="*80)
+    
+    try:
+        vec = embed_text(query_text)
+        rows = execute_candidates_query(RRF_SQL, {"vec": vec, "k": RRF_K, "limit": limit})
+        
+        if not rows:
+            print("❌ No results found")
+            return
+        
+        print(f"✅ Found {len(rows)} results:")
+        print()
+        
+        for i, row in enumerate(rows, 1):
+            (id, doc_title, page_num, section, preview, similarity,
+             priority, sim_rank, priority_rank, rrf_score) = row
+            
+            print(f"🏆 Rank {i} (RRF: {rrf_score})")
+            print(f"   📄 Document: {doc_title}")
+            if page_num:
+                print(f"   📖 Page: {page_num}")
+            if section:
+                print(f"   📑 Section: {section}")
+            print(f"   📝 Preview: {preview}...")
+            print(f"   📊 Similarity {similarity} (rank {sim_rank}) | Priority {priority} (rank {priority_rank})")
+            print()
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+
 def run_simple_ranked(query_text: str, limit: int = 5):
     """
     Simple ranked query without JSONB metadata (fallback)
@@ -106,25 +299,24 @@ def run_simple_ranked(query_text: str, limit: int = 5):
     print("="*60)
     
     try:
-        vec: List[float] = embed_text(query_text)
-        vec_literal = "'" + "[" + ",".join(f"{x:.7f}" for x in vec) + "]" + "'"
+        vec = embed_text(query_text)
 
-        sql = f"""
+        sql = """
         SELECT 
             id,
             document_title,
             page_number,
             section_title,
             LEFT(text, 200) AS preview,
-            ROUND((1 - (embedding <=> {vec_literal}::vector))::numeric, 4) AS similarity
+            ROUND((1 - (embedding <=> %(vec)s::vector))::numeric, 4) AS similarity
         FROM document_chunks
         WHERE embedding IS NOT NULL
-        ORDER BY embedding <=> {vec_literal}::vector
-        LIMIT {limit};
+        ORDER BY embedding <=> %(vec)s::vector
+        LIMIT %(limit)s;
         """
 
         with get_conn() as conn, conn.cursor() as cur:
-            cur.execute(sql)
+            cur.execute(sql, {"vec": vec, "limit": limit})
             rows = cur.fetchall()
             
             print(f"✅ Found {len(rows)} results:")
@@ -161,30 +353,63 @@ def demonstrate_ranking_strategies():
         ("Priority heavy", 0.3, 0.7)
     ]
     
+    # The embedding and candidate set are the same for every strategy -
+    # only the weights change - so embed and query once, then re-sort
+    try:
+        print("🔄 Generating embedding...")
+        vec = embed_text(test_query)
+        candidates = fetch_candidates(vec)
+        print(f"✅ Fetched {len(candidates)} candidates, re-ranking them per strategy")
+    except Exception as e:
+        print(f"   ❌ Error: {e}")
+        # Fallback to simple ranking
+        run_simple_ranked(test_query, limit=3)
+        return
+    
     for name, sim_weight, priority_weight in strategies:
         print(f"\n📊 Strategy: {name}")
         print(f"   Weights - Similarity: {sim_weight}, Priority: {priority_weight}")
         print("-" * 60)
         
-        try:
-            run_ranked_query(test_query, sim_weight, priority_weight, limit=3)
-        except Exception as e:
-            print(f"   ❌ Error: {e}")
-            # Fallback to simple ranking
-            run_simple_ranked(test_query, limit=3)
+        print_ranked_rows(rank_candidates(candidates, sim_weight, priority_weight, limit=3))
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python 05_ranked_query.py \"<query text>\" [--strategies]")
+        print("Usage: python 05_ranked_query.py \"<query text>\" [--strategies | --rrf]")
         print("Examples:")
         print("  python 05_ranked_query.py \"How do I reset my password?\"")
         print("  python 05_ranked_query.py \"WiFi setup\" --strategies")
+        print("  python 05_ranked_query.py \"VPN access\" --rrf")
         sys.exit(1)
 
-    query_text = sys.argv[1]
+    # Reject empty or over-long queries before building indexes or calling Ollama
+    try:
+        query_text = normalize_query(sys.argv[1])
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    
+    try:
+        params = ensure_hnsw_index()
+        print(f"🗂️  HNSW index ready (m={params['m']}, ef_construction={params['ef_construction']}, ef_search={params['ef_search']})")
+    except Exception as e:
+        print(f"⚠️  Could not create HNSW index: {e}")
+    
+    if BINARY_PREFILTER:
+        try:
+            ensure_binary_index()
+        except Exception as e:
+            print(f"⚠️  Could not create binary quantized index: {e}")
+    
+    try:
+        ensure_ranking_columns()
+    except Exception as e:
+        print(f"⚠️  Could not add priority/relevance columns: {e}")
     
     if len(sys.argv) > 2 and sys.argv[2] == "--strategies":
         demonstrate_ranking_strategies()
+    elif len(sys.argv) > 2 and sys.argv[2] == "--rrf":
+        run_rrf_query(query_text)
     else:
         try:
             # Try advanced ranked query first
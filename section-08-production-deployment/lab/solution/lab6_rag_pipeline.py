@@ -31,6 +31,14 @@ EMBEDDING_MODEL = "bge-m3"
 OPENAI_API_KEY = "API_KEY"  # Replace with actual key
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 
+# One keep-alive session for Ollama and OpenAI calls, so repeated queries
+# skip the TCP (and TLS) handshake
+http = requests.Session()
+
+# Query embeddings fetched ahead of time in one batch by prefetch_embeddings();
+# get_embedding() uses (and drops) an entry instead of calling Ollama again
+_prefetched: Dict[str, List[float]] = {}
+
 @dataclass
 class SearchResult:
     """Represents a search result chunk."""
@@ -56,6 +64,10 @@ class RAGResponse:
 
 def get_embedding(text: str, max_retries: int = 3) -> Optional[List[float]]:
     """Generate embedding for text using Ollama BGE-M3 model."""
+    prefetched = _prefetched.pop(text, None)
+    if prefetched is not None:
+        return prefetched
+    
     for attempt in range(max_retries):
         try:
             payload = {
@@ -63,7 +75,7 @@ def get_embedding(text: str, max_retries: int = 3) -> Optional[List[float]]:
                 "input": text
             }
             
-            response = requests.post(OLLAMA_URL, json=payload, timeout=30)
+            response = http.post(OLLAMA_URL, json=payload, timeout=30)
             response.raise_for_status()
             
             result = response.json()
@@ -78,6 +90,38 @@ def get_embedding(text: str, max_retries: int = 3) -> Optional[List[float]]:
     
     return None
 
+def get_embeddings(texts: List[str], max_retries: int = 3, timeout: float = 30) -> Optional[List[List[float]]]:
+    """Generate embeddings for several texts in one Ollama request."""
+    for attempt in range(max_retries):
+        try:
+            payload = {
+                "model": EMBEDDING_MODEL,
+                "input": texts
+            }
+            
+            response = http.post(OLLAMA_URL, json=payload, timeout=timeout)
+            response.raise_for_status()
+            
+            result = response.json()
+            embeddings = result.get("embeddings", [])
+            
+            if len(embeddings) == len(texts) and all(len(e) == 1024 for e in embeddings):
+                return embeddings
+        except Exception as e:
+            if attempt == max_retries - 1:
+                print(f"⚠️  Batch embedding failed: {e}")
+                break
+            time.sleep(1)
+    
+    return None
+
+def prefetch_embeddings(texts: List[str]) -> Optional[List[List[float]]]:
+    """Embed texts in one batch so later get_embedding calls for them are free."""
+    embeddings = get_embeddings(texts)
+    if embeddings is not None:
+        _prefetched.update(zip(texts, embeddings))
+    return embeddings
+
 def search_similar_chunks(query: str, limit: int = 5, 
                          similarity_threshold: float = 0.4) -> List[SearchResult]:
     """Search for document chunks similar to the user query."""
@@ -91,6 +135,8 @@ def search_similar_chunks(query: str, limit: int = 5,
     try:
         with psycopg.connect(**DB_CONFIG) as conn:
             with conn.cursor() as cur:
+                # A named parameter used twice is sent once, so the 1024-float
+                # embedding is serialized and transferred a single time
                 cur.execute("""
                     SELECT 
                         id,
@@ -98,12 +144,12 @@ def search_similar_chunks(query: str, limit: int = 5,
                         document_title,
                         page_number,
                         section_title,
-                        1 - (embedding <=> %s::vector) as similarity_score
+                        1 - (embedding <=> %(vec)s::vector) as similarity_score
                     FROM document_chunks
                     WHERE embedding IS NOT NULL
-                    ORDER BY embedding <=> %s::vector
-                    LIMIT %s;
-                """, (query_embedding, query_embedding, limit))
+                    ORDER BY embedding <=> %(vec)s::vector
+                    LIMIT %(limit)s;
+                """, {"vec": query_embedding, "limit": limit})
                 
                 results = cur.fetchall()
                 
@@ -218,7 +264,7 @@ Please provide a helpful, accurate answer based on the context above. Remember t
         }
         
         # Make the API request
-        response = requests.post(
+        response = http.post(
             OPENAI_API_URL,
             headers=headers,
             json=payload,
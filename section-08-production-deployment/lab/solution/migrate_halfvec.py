@@ -0,0 +1,82 @@
+# migrate_halfvec.py
+# Store document_chunks.embedding as halfvec(1024) instead of vector(1024).
+# Half-precision floats halve the bytes read per distance calculation (about
+# 2KB instead of 4KB per row) with negligible recall loss for bge-m3.
+# Run: python migrate_halfvec.py
+#
+# Note: ALTER COLUMN TYPE rewrites the table under an exclusive lock - run it
+# while nothing else is querying document_chunks.
+
+import sys
+import os
+if os.path.dirname(__file__) not in sys.path:
+    sys.path.append(os.path.dirname(__file__))
+from common import get_admin_conn, select_one, run_sql, embedding_column_type, ensure_hnsw_index
+
+AVG_SIZE_SQL = "SELECT AVG(pg_column_size(embedding))::int FROM document_chunks WHERE embedding IS NOT NULL;"
+
+# Generated columns computed from embedding (e.g. Section 6's embedding_h);
+# PostgreSQL refuses to change the type of a column they depend on
+DEPENDENT_GENERATED_SQL = """
+SELECT gen.attname
+FROM pg_attribute gen
+JOIN pg_attrdef def ON def.adrelid = gen.attrelid AND def.adnum = gen.attnum
+JOIN pg_depend dep ON dep.classid = 'pg_attrdef'::regclass AND dep.objid = def.oid
+JOIN pg_attribute src ON src.attrelid = dep.refobjid AND src.attnum = dep.refobjsubid
+WHERE gen.attrelid = 'document_chunks'::regclass
+  AND gen.attgenerated <> ''
+  AND src.attname = 'embedding';
+"""
+
+def main():
+    print("🔄 HALFVEC MIGRATION")
+    print("="*80)
+
+    if embedding_column_type() == "halfvec":
+        print("✅ embedding is already stored as halfvec - nothing to do")
+        return
+
+    # Checked before anything is dropped, so a blocked migration changes nothing
+    dependents = [name for (name,) in run_sql(DEPENDENT_GENERATED_SQL)]
+    if dependents:
+        print(f"❌ Generated column(s) computed from embedding: {', '.join(dependents)}")
+        print("   The column type can't change while they depend on it.")
+        print("   embedding_h (Section 6) is already a halfvec copy; after this migration")
+        print("   embedding holds the same data, so drop the copy first:")
+        for name in dependents:
+            print(f"     ALTER TABLE document_chunks DROP COLUMN {name};")
+        sys.exit(1)
+
+    before = select_one(AVG_SIZE_SQL)
+    print(f"📏 Average embedding size before: {before} bytes")
+
+    with get_admin_conn() as conn, conn.cursor() as cur:
+        # Indexes built with vector_* operator classes can't be converted,
+        # so drop them; the HNSW index is recreated with halfvec_cosine_ops
+        cur.execute("""
+            SELECT indexname FROM pg_indexes
+            WHERE tablename = 'document_chunks'
+              AND indexdef ~ '\\(embedding vector_\\w+_ops\\)';
+        """)
+        for (index_name,) in cur.fetchall():
+            print(f"🗑️  Dropping index {index_name}")
+            cur.execute(f"DROP INDEX IF EXISTS {index_name};")
+
+        print("🔄 Converting embedding column to halfvec(1024)...")
+        cur.execute("""
+            ALTER TABLE document_chunks
+            ALTER COLUMN embedding TYPE halfvec(1024)
+            USING embedding::halfvec(1024);
+        """)
+        conn.commit()
+
+    print("🔄 Rebuilding HNSW index...")
+    ensure_hnsw_index()
+
+    after = select_one(AVG_SIZE_SQL)
+    print(f"📏 Average embedding size after: {after} bytes")
+    print("✅ Migration complete")
+    print("💡 Queries can keep binding %s::vector - PostgreSQL casts it to halfvec")
+
+if __name__ == "__main__":
+    main()
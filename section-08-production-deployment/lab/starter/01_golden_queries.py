@@ -4,8 +4,9 @@
 from typing import List, Dict
 import sys
 import os
-sys.path.append(os.path.dirname(__file__))
-from common import get_rag_pipeline
+if os.path.dirname(__file__) not in sys.path:
+    sys.path.append(os.path.dirname(__file__))
+from common import get_rag_pipeline, run_queries_concurrently
 
 # TODO: Define your golden set of test queries with expected answers
 # These should be queries you know the system should be able to answer
@@ -34,8 +35,12 @@ def run():
     # TODO: Get the RAG pipeline
     # rag = get_rag_pipeline()
     
-    # TODO: Loop through golden_set and test each query
-    # for i, item in enumerate(golden_set, 1):
+    # TODO: Run every query up front - they're independent, so
+    # run_queries_concurrently() overlaps their network waits
+    # results = run_queries_concurrently(rag, [item["query"] for item in golden_set])
+    
+    # TODO: Loop through golden_set and print each result
+    # for i, (item, (response, error)) in enumerate(zip(golden_set, results), 1):
     #     q = item["query"]
     #     expected_hint = item["expected"]
     #     
@@ -44,8 +49,8 @@ def run():
     #     print("-" * 60)
     #     
     #     try:
-    #         # TODO: Call RAG pipeline and handle response
-    #         # response = rag(q)
+    #         if error is not None:
+    #             raise error
     #         # TODO: Print results (handle RAGResponse vs string)
     #     except Exception as e:
     #         print(f"❌ Error: {e}")
@@ -8,7 +8,8 @@ import sys
 import json
 import os
 from typing import List
-sys.path.append(os.path.dirname(__file__))
+if os.path.dirname(__file__) not in sys.path:
+    sys.path.append(os.path.dirname(__file__))
 from common import embed_text, get_conn
 
 def main():
@@ -38,7 +39,8 @@ def main():
         # TODO: Generate embedding
         print("🔄 Generating embedding...")
         # vec: List[float] = embed_text(query_text)
-        # vec_literal = "'" + "[" + ",".join(f"{x:.7f}" for x in vec) + "]" + "'"
+        # The vector is passed to cur.execute() as the %(vec)s parameter rather than
+        # formatted into the SQL, so there's no 1024-float string to build and parse
         # print(f"✅ Generated {len(vec)}-dimensional embedding")
 
         # TODO: Prepare EXPLAIN ANALYZE query using document_chunks table
@@ -50,10 +52,10 @@ def main():
         #     document_title,
         #     page_number,
         #     section_title,
-        #     1 - (embedding {op} {vec_literal}::vector) as similarity_score
+        #     1 - (embedding {op} %(vec)s::vector) as similarity_score
         # FROM document_chunks
         # WHERE embedding IS NOT NULL
-        # ORDER BY embedding {op} {vec_literal}::vector
+        # ORDER BY embedding {op} %(vec)s::vector
         # LIMIT 5;
         # """
 
@@ -63,7 +65,7 @@ def main():
 
         # TODO: Execute query and display results
         # with get_conn() as conn, conn.cursor() as cur:
-        #     cur.execute(sql)
+        #     cur.execute(sql, {"vec": vec})
         #     plan_lines = [row[0] for row in cur.fetchall()]
         #     
         #     for line in plan_lines:
@@ -99,7 +101,6 @@ def compare_index_types(query_text: str):
     try:
         # TODO: Generate embedding
         # vec: List[float] = embed_text(query_text)
-        # vec_literal = "'" + "[" + ",".join(f"{x:.7f}" for x in vec) + "]" + "'"
         
         # TODO: Test different distance operators
         operators = [
@@ -114,31 +115,35 @@ def compare_index_types(query_text: str):
             
             # TODO: Execute EXPLAIN ANALYZE for each operator
             # sql = f"""
-            # EXPLAIN (ANALYZE, BUFFERS)
+            # EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
             # SELECT id, document_title, page_number
             # FROM document_chunks
             # WHERE embedding IS NOT NULL
-            # ORDER BY embedding {op} {vec_literal}::vector
+            # ORDER BY embedding {op} %(vec)s::vector
             # LIMIT 5;
             # """
             
+            # FORMAT JSON returns the plan as one parsed object, so metrics are
+            # named fields rather than lines to search for substrings.
+            # SET LOCAL enable_seqscan = off shows the index plan even on a tiny
+            # dev table where the planner would rather scan sequentially.
             # with get_conn() as conn, conn.cursor() as cur:
-            #     cur.execute(sql)
-            #     plan_lines = [row[0] for row in cur.fetchall()]
+            #     cur.execute("SET LOCAL enable_seqscan = off;")
+            #     cur.execute("SET LOCAL hnsw.ef_search = 40;")
+            #     cur.execute(sql, {"vec": vec})
+            #     plan = cur.fetchone()[0][0]
             #     
             #     # Extract key metrics
-            #     for line in plan_lines:
-            #         if "Execution Time:" in line:
-            #             print(f"⏱️  {line}")
-            #         elif "Planning Time:" in line:
-            #             print(f"📋 {line}")
-            #         elif "Index" in line and "Scan" in line:
-            #             print(f"🔍 {line}")
+            #     print(f"⏱️  Execution Time: {plan['Execution Time']:.3f} ms")
+            #     print(f"📋 Planning Time: {plan['Planning Time']:.3f} ms")
+            #     # TODO: Walk plan["Plan"] and its "Plans" children looking for
+            #     # a "Node Type" containing "Index" (and its "Index Name")
         
         print(f"\n💡 Recommendations:")
         print(f"  • Use cosine similarity (<=>) for most text similarity tasks")
         print(f"  • L2 distance (<->) is faster but may be less accurate for text")
-        print(f"  • Ensure you have a vector index: CREATE INDEX ON document_chunks USING ivfflat (embedding vector_cosine_ops);")
+        print(f"  • Ensure you have a vector index: CREATE INDEX ON document_chunks USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);")
+        print(f"  • HNSW beats ivfflat on recall and latency for small-LIMIT top-K searches")
         
     except Exception as e:
         print(f"❌ Error during comparison: {e}")
@@ -6,7 +6,8 @@ import sys
 import json
 import os
 from typing import List, Dict, Any
-sys.path.append(os.path.dirname(__file__))
+if os.path.dirname(__file__) not in sys.path:
+    sys.path.append(os.path.dirname(__file__))
 from common import embed_text, get_conn
 
 def run_ranked_query(query_text: str, sim_weight: float = 0.8, priority_weight: float = 0.2, limit: int = 10):
@@ -28,25 +29,46 @@ def run_ranked_query(query_text: str, sim_weight: float = 0.8, priority_weight:
         # TODO: Generate embedding
         print("🔄 Generating embedding...")
         # vec: List[float] = embed_text(query_text)
-        # vec_literal = "'" + "[" + ",".join(f"{x:.7f}" for x in vec) + "]" + "'"
+        # The vector is passed to cur.execute() as the %(vec)s parameter rather than
+        # formatted into the SQL, so there's no 1024-float string to build and parse
         # print(f"✅ Generated {len(vec)}-dimensional embedding")
 
         # TODO: Create ranked query with JSONB metadata
-        # sql = f"""
-        # WITH scored AS (
-        #   SELECT
-        #     id,
-        #     text,
-        #     document_title,
-        #     page_number,
-        #     section_title,
-        #     LEFT(text, 160) AS preview,
-        #     1 - (embedding <=> {vec_literal}::vector) AS similarity,
-        #     COALESCE((metadata->>'priority')::int, 0) AS priority,
-        #     COALESCE((metadata->>'relevance')::float, 0.5) AS relevance,
-        #     COALESCE((metadata->>'last_updated')::text, 'unknown') AS last_updated
+        # Recommended pattern: store priority/relevance as generated columns once,
+        # so ranking reads plain columns instead of parsing JSONB on every row:
+        #   ALTER TABLE document_chunks
+        #   ADD COLUMN IF NOT EXISTS priority int
+        #       GENERATED ALWAYS AS ((metadata->>'priority')::int) STORED,
+        #   ADD COLUMN IF NOT EXISTS relevance real
+        #       GENERATED ALWAYS AS ((metadata->>'relevance')::real) STORED;
+        # (If Section 7 already added priority as an ordinary column, IF NOT EXISTS
+        # keeps that copy, which doesn't follow metadata - drop it first.)
+        # Then rank in two stages: the candidates CTE orders by the raw distance
+        # operator so the vector index can serve it, and only those rows are
+        # re-scored with the weights. (Without the columns, use the
+        # COALESCE((metadata->>'priority')::int, 0) expressions instead.)
+        # The weights and limit are bound parameters too, so every strategy sends
+        # the same SQL text and Postgres can reuse one prepared plan.
+        # sql = """
+        # WITH candidates AS (
+        #   SELECT id, priority, relevance, embedding <=> %(vec)s::vector AS distance
         #   FROM document_chunks
         #   WHERE embedding IS NOT NULL
+        #   ORDER BY embedding <=> %(vec)s::vector
+        #   LIMIT 50
+        # ),
+        # scored AS (
+        #   SELECT
+        #     c.id,
+        #     d.document_title,
+        #     d.page_number,
+        #     d.section_title,
+        #     LEFT(d.text, 160) AS preview,
+        #     1 - c.distance AS similarity,
+        #     COALESCE(c.priority, 0) AS priority,
+        #     COALESCE(c.relevance, 0.5) AS relevance,
+        #     COALESCE(d.metadata->>'last_updated', 'unknown') AS last_updated
+        #   FROM candidates c JOIN document_chunks d USING (id)
         # )
         # SELECT
         #   id,
@@ -57,11 +79,11 @@ def run_ranked_query(query_text: str, sim_weight: float = 0.8, priority_weight:
         #   ROUND(similarity::numeric, 4) AS similarity,
         #   priority,
         #   ROUND(relevance::numeric, 4) AS relevance,
-        #   ROUND((similarity * {sim_weight} + priority * {priority_weight} + relevance * 0.1)::numeric, 4) AS final_score,
+        #   ROUND((similarity * %(sim_weight)s + priority * %(priority_weight)s + relevance * 0.1)::numeric, 4) AS final_score,
         #   last_updated
         # FROM scored
         # ORDER BY final_score DESC
-        # LIMIT {limit};
+        # LIMIT %(limit)s;
         # """
 
         print("\n📋 Executing ranked query...")
@@ -69,8 +91,12 @@ def run_ranked_query(query_text: str, sim_weight: float = 0.8, priority_weight:
         print("TODO: Implement the ranked query execution")
 
         # TODO: Execute query and display results
+        # params = {"vec": vec, "sim_weight": sim_weight, "priority_weight": priority_weight, "limit": limit}
         # with get_conn() as conn, conn.cursor() as cur:
-        #     cur.execute(sql)
+        #     # hnsw.ef_search defaults to 40: the index would return at most 40 of
+        #     # the 50 candidates. Raise it for this transaction only.
+        #     cur.execute("SET LOCAL hnsw.ef_search = 100;")
+        #     cur.execute(sql, params, prepare=True)
         #     rows = cur.fetchall()
         #     
         #     if not rows:
@@ -120,7 +146,6 @@ def run_simple_ranked(query_text: str, limit: int = 5):
     try:
         # TODO: Generate embedding
         # vec: List[float] = embed_text(query_text)
-        # vec_literal = "'" + "[" + ",".join(f"{x:.7f}" for x in vec) + "]" + "'"
 
         # TODO: Create simple similarity query
         # sql = f"""
@@ -130,10 +155,10 @@ def run_simple_ranked(query_text: str, limit: int = 5):
         #     page_number,
         #     section_title,
         #     LEFT(text, 200) AS preview,
-        #     ROUND((1 - (embedding <=> {vec_literal}::vector))::numeric, 4) AS similarity
+        #     ROUND((1 - (embedding <=> %(vec)s::vector))::numeric, 4) AS similarity
         # FROM document_chunks
         # WHERE embedding IS NOT NULL
-        # ORDER BY embedding <=> {vec_literal}::vector
+        # ORDER BY embedding <=> %(vec)s::vector
         # LIMIT {limit};
         # """
 
@@ -91,6 +91,8 @@ def search_similar_chunks(query: str, limit: int = 5,
     try:
         with psycopg.connect(**DB_CONFIG) as conn:
             with conn.cursor() as cur:
+                # A named parameter used twice is sent once, so the 1024-float
+                # embedding is serialized and transferred a single time
                 cur.execute("""
                     SELECT 
                         id,
@@ -98,12 +100,12 @@ def search_similar_chunks(query: str, limit: int = 5,
                         document_title,
                         page_number,
                         section_title,
-                        1 - (embedding <=> %s::vector) as similarity_score
+                        1 - (embedding <=> %(vec)s::vector) as similarity_score
                     FROM document_chunks
                     WHERE embedding IS NOT NULL
-                    ORDER BY embedding <=> %s::vector
-                    LIMIT %s;
-                """, (query_embedding, query_embedding, limit))
+                    ORDER BY embedding <=> %(vec)s::vector
+                    LIMIT %(limit)s;
+                """, {"vec": query_embedding, "limit": limit})
                 
                 results = cur.fetchall()
                 
@@ -6,39 +6,105 @@ Run this to check if your implementations are working correctly.
 
 import sys
 import os
+import io
+import importlib
+import importlib.util
 import subprocess
+import threading
 import time
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import List, Dict, Any
 
+# What the checks look for, defined once
+EXERCISE_MODULES = (
+    "01_golden_queries",
+    "02_simple_scoring",
+    "03_healthcheck_app",
+    "04_explain_query",
+    "05_ranked_query",
+)
+REQUIRED_GOLDEN_KEYS = frozenset(("query", "expected"))
+REQUIRED_EVAL_KEYS = frozenset(("basic_eval", "has_answer", "confidence", "chunks_found", "response_time", "success"))
+EXPECTED_ROUTES = frozenset(("/", "/health", "/health/detailed"))
+
+# Stop at the first failing test: pass --fail-fast, or it's on by default in CI
+FAIL_FAST = "--fail-fast" in sys.argv or os.environ.get("CI") == "true"
+
+class _ThreadOutput:
+    """
+    Stand-in for sys.stdout that sends each thread's prints to that thread's
+    buffer (if it has one), so tests running side by side don't interleave
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        return getattr(self.local, "buffer", self.stream).write(text)
+
+    def flush(self):
+        getattr(self.local, "buffer", self.stream).flush()
+
+def run_buffered(test_func, output: _ThreadOutput):
+    """Run one test with its output captured; returns (result or exception, output text)"""
+    output.local.buffer = io.StringIO()
+    try:
+        result = test_func()
+    except Exception as e:
+        result = e
+    finally:
+        text = output.local.buffer.getvalue()
+        del output.local.buffer
+    return result, text
+
+# Exercise modules by name, imported once and shared by every test. The file
+# names start with a digit, so they can't be imported with a plain import
+# statement (there is no "golden_queries" module to import from).
+_MODS: Dict[str, Any] = {}
+
+def get_module(name: str):
+    """Import a module once and reuse it"""
+    if name not in _MODS:
+        _MODS[name] = importlib.import_module(name)
+    return _MODS[name]
+
+@lru_cache(maxsize=1)
+def session_pipeline() -> tuple:
+    """
+    Build the RAG pipeline once for the whole run
+    Returns (pipeline, None), or (None, error) if it couldn't be built - the
+    failure is kept too, so later tests don't retry a broken import
+    """
+    try:
+        return get_module("common").get_rag_pipeline(), None
+    except Exception as e:
+        return None, e
+
 def test_imports():
-    """Test that all modules can be imported without errors."""
+    """
+    Test that all exercise modules can be found.
+    Only the module specs are resolved here; each module is actually run
+    (and any import error reported) by the test that needs it.
+    """
     print("🔍 Testing imports...")
     
-    modules = [
-        "01_golden_queries",
-        "02_simple_scoring", 
-        "03_healthcheck_app",
-        "04_explain_query",
-        "05_ranked_query"
-    ]
-    
-    for module in modules:
-        try:
-            __import__(module)
+    all_found = True
+    for module in EXERCISE_MODULES:
+        if importlib.util.find_spec(module) is not None:
             print(f"  ✅ {module}")
-        except Exception as e:
-            print(f"  ❌ {module}: {e}")
-            return False
+        else:
+            print(f"  ❌ {module}: not found")
+            all_found = False
     
-    return True
+    return all_found
 
 def test_golden_queries():
     """Test golden queries implementation."""
     print("\n🧪 Testing golden queries...")
     
     try:
-        from golden_queries import run, golden_set
+        golden_set = get_module("01_golden_queries").golden_set
         
         # Check if golden_set is defined and not empty
         if not golden_set or len(golden_set) == 0:
@@ -46,10 +112,9 @@ def test_golden_queries():
             return False
         
         # Check if queries have expected structure
-        for item in golden_set:
-            if "query" not in item or "expected" not in item:
-                print("  ❌ golden_set items must have 'query' and 'expected' keys")
-                return False
+        if not all(REQUIRED_GOLDEN_KEYS <= item.keys() for item in golden_set):
+            print("  ❌ golden_set items must have 'query' and 'expected' keys")
+            return False
         
         print(f"  ✅ Found {len(golden_set)} test queries")
         return True
@@ -63,7 +128,8 @@ def test_simple_scoring():
     print("\n📊 Testing simple scoring...")
     
     try:
-        from simple_scoring import simple_eval, detailed_eval, golden_set
+        scoring = get_module("02_simple_scoring")
+        simple_eval, detailed_eval = scoring.simple_eval, scoring.detailed_eval
         
         # Test simple_eval function
         test_response = "The library is open from 9am to 5pm"
@@ -76,12 +142,10 @@ def test_simple_scoring():
         
         # Test detailed_eval function
         eval_result = detailed_eval(test_response, test_expected)
-        required_keys = ["basic_eval", "has_answer", "confidence", "chunks_found", "response_time", "success"]
-        
-        for key in required_keys:
-            if key not in eval_result:
-                print(f"  ❌ detailed_eval missing key: {key}")
-                return False
+        missing = REQUIRED_EVAL_KEYS - eval_result.keys()
+        if missing:
+            print(f"  ❌ detailed_eval missing keys: {', '.join(sorted(missing))}")
+            return False
         
         print("  ✅ Scoring functions implemented")
         return True
@@ -95,7 +159,7 @@ def test_healthcheck_app():
     print("\n🏥 Testing health check app...")
     
     try:
-        from healthcheck_app import app
+        app = get_module("03_healthcheck_app").app
         
         # Test that Flask app is created
         if not app:
@@ -103,13 +167,11 @@ def test_healthcheck_app():
             return False
         
         # Test that routes are defined
-        routes = [rule.rule for rule in app.url_map.iter_rules()]
-        expected_routes = ["/", "/health", "/health/detailed"]
-        
-        for route in expected_routes:
-            if route not in routes:
-                print(f"  ❌ Missing route: {route}")
-                return False
+        routes = frozenset(rule.rule for rule in app.url_map.iter_rules())
+        missing = EXPECTED_ROUTES - routes
+        if missing:
+            print(f"  ❌ Missing routes: {', '.join(sorted(missing))}")
+            return False
         
         print("  ✅ Health check app structure looks good")
         return True
@@ -123,7 +185,8 @@ def test_explain_query():
     print("\n🔍 Testing explain query...")
     
     try:
-        from explain_query import main, compare_index_types
+        explain = get_module("04_explain_query")
+        main, compare_index_types = explain.main, explain.compare_index_types
         
         # Test that functions are callable
         if not callable(main):
@@ -146,10 +209,10 @@ def test_ranked_query():
     print("\n🏆 Testing ranked query...")
     
     try:
-        from ranked_query import run_ranked_query, run_simple_ranked, demonstrate_ranking_strategies, main
+        ranked = get_module("05_ranked_query")
         
         # Test that functions are callable
-        functions = [run_ranked_query, run_simple_ranked, demonstrate_ranking_strategies, main]
+        functions = [ranked.run_ranked_query, ranked.run_simple_ranked, ranked.demonstrate_ranking_strategies, ranked.main]
         
         for func in functions:
             if not callable(func):
@@ -168,10 +231,10 @@ def test_common_module():
     print("\n🔧 Testing common module...")
     
     try:
-        from common import get_rag_pipeline, embed_text, get_conn, check_database_health
+        common = get_module("common")
         
         # Test that functions are callable
-        functions = [get_rag_pipeline, embed_text, get_conn, check_database_health]
+        functions = [common.get_rag_pipeline, common.embed_text, common.get_conn, common.check_database_health]
         
         for func in functions:
             if not callable(func):
@@ -191,14 +254,14 @@ def run_integration_test():
     
     try:
         # Test that we can import and call basic functions
-        from common import get_rag_pipeline
+        get_module("common")
         
         # This might fail if RAG pipeline is not available, which is OK
-        try:
-            rag = get_rag_pipeline()
+        rag, error = session_pipeline()
+        if error is None:
             print("  ✅ RAG pipeline accessible")
-        except Exception as e:
-            print(f"  ⚠️  RAG pipeline not accessible: {e}")
+        else:
+            print(f"  ⚠️  RAG pipeline not accessible: {error}")
             print("  💡 This is OK if you haven't completed Section 6 yet")
         
         return True
@@ -226,12 +289,30 @@ def main():
     passed = 0
     total = len(tests)
     
-    for test_name, test_func in tests:
-        try:
-            if test_func():
-                passed += 1
-        except Exception as e:
-            print(f"  ❌ {test_name} test crashed: {e}")
+    # The tests share no state, so they run side by side; each one's output
+    # is buffered and printed in the original order once it's done.
+    # With fail-fast they run one at a time, so the tests after a failure
+    # can be cancelled before they start.
+    output = _ThreadOutput(sys.stdout)
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=1 if FAIL_FAST else total) as executor:
+            futures = [(name, executor.submit(run_buffered, func, output)) for name, func in tests]
+            for test_name, future in futures:
+                result, text = future.result()
+                print(text, end="")
+                if isinstance(result, Exception):
+                    print(f"  ❌ {test_name} test crashed: {result}")
+                elif result:
+                    passed += 1
+                    continue
+                if FAIL_FAST:
+                    for _, pending in futures:
+                        pending.cancel()
+                    print(f"\n⏹️  Stopping after the first failure ({test_name}) - remaining tests skipped")
+                    break
+    finally:
+        sys.stdout = output.stream
     
     print("\n" + "="*60)
     print(f"📊 TEST RESULTS: {passed}/{total} tests passed")